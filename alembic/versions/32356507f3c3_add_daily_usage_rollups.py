@@ -0,0 +1,78 @@
+"""add daily usage rollups
+
+Revision ID: 32356507f3c3
+Revises: 3657c5eda89f
+Create Date: 2026-10-17 03:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '32356507f3c3'
+down_revision: Union[str, None] = '3657c5eda89f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    tables = set(sa.inspect(bind).get_table_names())
+
+    # На новой базе таблицы уже созданы через Base.metadata.create_all
+    if "command_daily_stats" not in tables:
+        op.create_table(
+            "command_daily_stats",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("command_name", sa.String(), primary_key=True),
+            sa.Column("count", sa.Integer(), nullable=False),
+        )
+    if "user_daily_stats" not in tables:
+        op.create_table(
+            "user_daily_stats",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("username", sa.String(), primary_key=True),
+            sa.Column("count", sa.Integer(), nullable=False),
+        )
+    if "user_command_daily_stats" not in tables:
+        op.create_table(
+            "user_command_daily_stats",
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("username", sa.String(), primary_key=True),
+            sa.Column("command_name", sa.String(), primary_key=True),
+            sa.Column("count", sa.Integer(), nullable=False),
+        )
+
+    # Пересчитываем сводки по уже накопленной истории
+    op.execute("DELETE FROM command_daily_stats")
+    op.execute("DELETE FROM user_daily_stats")
+    op.execute("DELETE FROM user_command_daily_stats")
+
+    op.execute(
+        "INSERT INTO command_daily_stats (day, command_name, count) "
+        "SELECT date(timestamp), command_name, count(*) FROM command_history "
+        "WHERE timestamp IS NOT NULL AND command_name IS NOT NULL AND command_name != '' "
+        "GROUP BY date(timestamp), command_name"
+    )
+    op.execute(
+        "INSERT INTO user_daily_stats (day, username, count) "
+        "SELECT date(timestamp), username, count(*) FROM command_history "
+        "WHERE timestamp IS NOT NULL AND username IS NOT NULL "
+        "GROUP BY date(timestamp), username"
+    )
+    op.execute(
+        "INSERT INTO user_command_daily_stats (day, username, command_name, count) "
+        "SELECT date(timestamp), username, command_name, count(*) FROM command_history "
+        "WHERE timestamp IS NOT NULL AND username IS NOT NULL "
+        "AND command_name IS NOT NULL AND command_name != '' "
+        "GROUP BY date(timestamp), username, command_name"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_command_daily_stats")
+    op.drop_table("user_daily_stats")
+    op.drop_table("command_daily_stats")
@@ -0,0 +1,79 @@
+"""add command_name to command_history
+
+Revision ID: 3657c5eda89f
+Revises: a18b5ceda286
+Create Date: 2026-10-17 02:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3657c5eda89f'
+down_revision: Union[str, None] = 'a18b5ceda286'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 5000
+
+
+def _extract_command_name(full_command: str) -> str:
+    # Та же логика, что и в utils.extract_command_name: "/cmd@bot args" -> "/cmd"
+    parts = (full_command or "").split()
+    if not parts:
+        return ""
+    return parts[0].split('@')[0]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # На новой базе столбец уже создан через Base.metadata.create_all
+    columns = {column["name"] for column in inspector.get_columns("command_history")}
+    if "command_name" not in columns:
+        op.add_column("command_history", sa.Column("command_name", sa.String(), nullable=True))
+
+    indexes = {index["name"] for index in inspector.get_indexes("command_history")}
+    if "ix_command_history_timestamp" not in indexes:
+        op.create_index("ix_command_history_timestamp", "command_history", ["timestamp"])
+    if "ix_command_history_command_name" not in indexes:
+        op.create_index("ix_command_history_command_name", "command_history", ["command_name"])
+
+    # Заполняем command_name для уже существующих записей пачками
+    history = sa.table(
+        "command_history",
+        sa.column("id", sa.Integer),
+        sa.column("command", sa.String),
+        sa.column("command_name", sa.String),
+    )
+
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(history.c.id, history.c.command)
+            .where(history.c.id > last_id, history.c.command_name.is_(None))
+            .order_by(history.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        bind.execute(
+            history.update()
+            .where(history.c.id == sa.bindparam("row_id"))
+            .values(command_name=sa.bindparam("name")),
+            [{"row_id": row_id, "name": _extract_command_name(command)} for row_id, command in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade() -> None:
+    op.drop_index("ix_command_history_command_name", table_name="command_history")
+    op.drop_index("ix_command_history_timestamp", table_name="command_history")
+    with op.batch_alter_table("command_history") as batch_op:
+        batch_op.drop_column("command_name")
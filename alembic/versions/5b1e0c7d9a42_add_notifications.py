@@ -0,0 +1,42 @@
+"""add notifications
+
+Revision ID: 5b1e0c7d9a42
+Revises: 32356507f3c3
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e0c7d9a42'
+down_revision: Union[str, None] = '32356507f3c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # На новой базе таблица уже создана через Base.metadata.create_all
+    if "notifications" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "notifications",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("chat_id", sa.Integer(), nullable=False),
+            sa.Column("message_thread_id", sa.Integer(), nullable=True),
+            sa.Column("team_name", sa.String(), nullable=False),
+            sa.Column("text", sa.String(), nullable=False),
+            sa.Column("is_important", sa.Boolean(), nullable=True),
+            sa.Column("created_by", sa.String(), nullable=True),
+            sa.Column("due_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_notifications_due_at", "notifications", ["due_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_notifications_due_at", table_name="notifications")
+    op.drop_table("notifications")
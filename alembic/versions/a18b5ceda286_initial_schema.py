@@ -0,0 +1,28 @@
+"""initial schema
+
+Revision ID: a18b5ceda286
+Revises: 
+Create Date: 2025-03-05 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a18b5ceda286'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Исходные таблицы создаются через Base.metadata.create_all (database.py),
+    # эта ревизия фиксирует их состояние, с которым поставляется bot_database.db
+    pass
+
+
+def downgrade() -> None:
+    pass
@@ -0,0 +1,272 @@
+# Стандартные библиотеки
+import argparse
+import csv
+import gzip
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator
+
+# Библиотеки сторонних разработчиков
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Локальные модули
+from database import SessionLocal
+from models import CommandHistory
+from history import utc_now
+from config import HISTORY_RETENTION_DAYS, HISTORY_ARCHIVE_DIR, HISTORY_ARCHIVE_CHUNK_SIZE
+
+
+# Порядок столбцов в архивных CSV файлах
+COLUMNS = ["id", "user_id", "user_telegram_id", "username", "command", "command_name", "timestamp"]
+
+# Пауза между пачками, чтобы запись истории из бота не ждала блокировку базы
+CHUNK_PAUSE = 0.05
+
+
+def archive_path(month: str, archive_dir: str = HISTORY_ARCHIVE_DIR) -> str:
+    """
+    Возвращает путь к архиву истории за месяц.
+
+    :param month: Месяц в формате YYYY-MM
+    :param archive_dir: Каталог архивов
+    :return: Путь к файлу архива
+    """
+    return os.path.join(archive_dir, f"command_history_{month}.csv.gz")
+
+
+def _append_rows(path: str, rows: list) -> None:
+    """
+    Дописывает строки в сжатый CSV. Каждая дозапись - отдельный gzip-поток в том же файле,
+    gzip читает такие файлы целиком, поэтому архив не нужно перепаковывать.
+
+    :param path: Путь к файлу архива
+    :param rows: Строки истории команд
+    """
+
+    is_new = not os.path.exists(path)
+    with gzip.open(path, "at", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        if is_new:
+            writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow([
+                "" if value is None else value.isoformat(sep=" ") if isinstance(value, datetime) else value
+                for value in row
+            ])
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def archive_command_history(
+    retention_days: int = HISTORY_RETENTION_DAYS,
+    chunk_size: int = HISTORY_ARCHIVE_CHUNK_SIZE,
+    archive_dir: str = HISTORY_ARCHIVE_DIR,
+) -> int:
+    """
+    Переносит записи истории команд старше retention_days дней в помесячные архивы и удаляет их из базы.
+    Записи обрабатываются пачками, каждая пачка удаляется отдельной короткой транзакцией
+    только после того, как она записана в архив. Дневные сводки статистики не затрагиваются.
+
+    :param retention_days: Сколько дней истории хранить в базе
+    :param chunk_size: Размер пачки
+    :param archive_dir: Каталог архивов
+    :return: Количество перенесенных записей
+    """
+
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = utc_now() - timedelta(days=retention_days)
+    columns = [getattr(CommandHistory, name) for name in COLUMNS]
+    archived = 0
+
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(*columns)
+                .where(CommandHistory.timestamp < cutoff)
+                .order_by(CommandHistory.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+
+            months: dict[str, list] = {}
+            for row in rows:
+                months.setdefault(row.timestamp.strftime("%Y-%m"), []).append(row)
+            for month, month_rows in months.items():
+                _append_rows(archive_path(month, archive_dir), month_rows)
+
+            # Пачка - это все старые записи в диапазоне id, поэтому удаляем по диапазону, а не списком id
+            db.execute(
+                delete(CommandHistory)
+                .where(
+                    CommandHistory.id.between(rows[0].id, rows[-1].id),
+                    CommandHistory.timestamp < cutoff,
+                )
+            )
+            db.commit()
+            archived += len(rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if len(rows) < chunk_size:
+            break
+        time.sleep(CHUNK_PAUSE)
+
+    return archived
+
+
+def list_archives(archive_dir: str = HISTORY_ARCHIVE_DIR) -> list[tuple[str, str]]:
+    """
+    Возвращает список архивов по месяцам.
+
+    :param archive_dir: Каталог архивов
+    :return: Список пар (месяц YYYY-MM, путь к файлу), отсортированный по месяцу
+    """
+
+    if not os.path.isdir(archive_dir):
+        return []
+
+    archives = []
+    for name in os.listdir(archive_dir):
+        if name.startswith("command_history_") and name.endswith(".csv.gz"):
+            month = name[len("command_history_"):-len(".csv.gz")]
+            archives.append((month, os.path.join(archive_dir, name)))
+    return sorted(archives)
+
+
+def iter_archive(
+    start_month: str | None = None,
+    end_month: str | None = None,
+    archive_dir: str = HISTORY_ARCHIVE_DIR,
+) -> Iterator[dict]:
+    """
+    Построчно читает архивы истории команд за диапазон месяцев, не загружая их в память целиком.
+    Записи, попавшие в архив повторно (если удаление пачки прервалось), пропускаются.
+
+    :param start_month: Первый месяц в формате YYYY-MM (включительно)
+    :param end_month: Последний месяц в формате YYYY-MM (включительно)
+    :param archive_dir: Каталог архивов
+    :return: Итератор записей со значениями столбцов CommandHistory
+    """
+
+    for month, path in list_archives(archive_dir):
+        if start_month and month < start_month or end_month and month > end_month:
+            continue
+
+        seen: set[int] = set()
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as file:
+            for row in csv.DictReader(file):
+                record_id = int(row["id"])
+                if record_id in seen:
+                    continue
+                seen.add(record_id)
+
+                yield {
+                    "id": record_id,
+                    "user_id": int(row["user_id"]),
+                    "user_telegram_id": int(row["user_telegram_id"]),
+                    "username": row["username"] or None,
+                    "command": row["command"],
+                    "command_name": row["command_name"] or None,
+                    "timestamp": datetime.fromisoformat(row["timestamp"]),
+                }
+
+
+def load_archive(records: Iterator[dict], database_url: str, chunk_size: int = HISTORY_ARCHIVE_CHUNK_SIZE) -> int:
+    """
+    Загружает записи из архива в отдельную базу для анализа (таблица command_history).
+
+    :param records: Записи истории команд
+    :param database_url: URL базы данных, например sqlite:///analytics.db
+    :param chunk_size: Размер пачки
+    :return: Количество прочитанных записей
+    """
+
+    target = create_engine(database_url)
+    CommandHistory.__table__.create(target, checkfirst=True)
+    statement = sqlite_insert(CommandHistory.__table__).on_conflict_do_nothing(index_elements=["id"])
+
+    loaded = 0
+    batch = []
+    try:
+        with target.begin() as connection:
+            for record in records:
+                batch.append(record)
+                if len(batch) >= chunk_size:
+                    connection.execute(statement, batch)
+                    loaded += len(batch)
+                    batch = []
+            if batch:
+                connection.execute(statement, batch)
+                loaded += len(batch)
+    finally:
+        target.dispose()
+    return loaded
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Консольная утилита для работы с архивом истории команд.
+
+    python archive.py run [--days N]                  - архивировать старые записи сейчас
+    python archive.py list                            - список архивов
+    python archive.py cat [--from YYYY-MM] [--to YYYY-MM] [--command /cmd] [--user username]
+                                                      - вывести записи в CSV (stdout)
+    python archive.py load --db sqlite:///analytics.db [--from YYYY-MM] [--to YYYY-MM]
+                                                      - загрузить записи в отдельную базу
+    """
+
+    parser = argparse.ArgumentParser(description="Архив истории команд")
+    parser.add_argument("--dir", default=HISTORY_ARCHIVE_DIR, help="Каталог архивов")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Архивировать старые записи")
+    run_parser.add_argument("--days", type=int, default=HISTORY_RETENTION_DAYS, help="Сколько дней истории оставить в базе")
+
+    subparsers.add_parser("list", help="Список архивов")
+
+    for name, description in (("cat", "Вывести записи в CSV"), ("load", "Загрузить записи в отдельную базу")):
+        sub = subparsers.add_parser(name, help=description)
+        sub.add_argument("--from", dest="start_month", help="Первый месяц (YYYY-MM)")
+        sub.add_argument("--to", dest="end_month", help="Последний месяц (YYYY-MM)")
+        sub.add_argument("--command", help="Только указанная команда (например, /help)")
+        sub.add_argument("--user", help="Только указанный пользователь")
+        if name == "load":
+            sub.add_argument("--db", required=True, help="URL базы, например sqlite:///analytics.db")
+
+    args = parser.parse_args(argv)
+
+    if args.action == "run":
+        archived = archive_command_history(retention_days=args.days, archive_dir=args.dir)
+        print(f"Перенесено в архив записей: {archived}")
+        return
+
+    if args.action == "list":
+        for month, path in list_archives(args.dir):
+            print(f"{month}\t{os.path.getsize(path)}\t{path}")
+        return
+
+    records = (
+        record for record in iter_archive(args.start_month, args.end_month, args.dir)
+        if (not args.command or record["command_name"] == args.command)
+        and (not args.user or record["username"] == args.user)
+    )
+
+    if args.action == "cat":
+        writer = csv.DictWriter(sys.stdout, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(records)
+    else:
+        loaded = load_archive(records, args.db)
+        print(f"Загружено записей: {loaded}")
+
+
+if __name__ == "__main__":
+    main()
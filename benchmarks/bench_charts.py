@@ -0,0 +1,166 @@
+"""
+Бенчмарк построения столбчатых графиков статистики в одном процессе:
+прежняя реализация (фигура и colormap на каждый график) против заготовки BarChartTemplate,
+а также время и размер картинки для каждого профиля рендеринга из CHART_PROFILES.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_charts [--runs 20] [--profiles]
+"""
+# Стандартные библиотеки
+import argparse
+import io
+import statistics
+import time
+
+# Библиотеки сторонних разработчиков
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import LinearSegmentedColormap
+
+# Локальные модули
+from charts import RenderProfile, profile_by_name
+from chart_render import generate_bar_chart, load_style
+from config import CHART_PROFILES
+
+
+SAMPLES = [
+    ("Топ команд за последние 30 дней", ["/help", "/casino", "/tag", "/top_users", "/balance"], [120, 95, 40, 12, 7]),
+    ("Топ пользователей за последние 7 дней", ["alice", "bob", "carol"], [31, 17, 4]),
+    ("Топ 5 по выигрышу за все время", ["dave", "erin", "frank", "grace", "heidi"], [15000, 9000, 7500, 3000, 1200]),
+]
+
+
+def generate_bar_chart_baseline(title, x_labels, y_values, x_label, y_label) -> bytes:
+    """Прежняя реализация: новая фигура, colormap и градиенты на каждый график."""
+    if not x_labels or not y_values:
+        raise ValueError("Нет данных для построения графика")
+
+    buffer = io.BytesIO()
+
+    # Стиль применяется из памяти и действует только на время построения графика
+    with plt.rc_context(load_style()):
+        fig, ax = plt.subplots(figsize=(12, 6))
+
+        # Определяем цветовые пары для градиентов
+        gradient_colors = [
+            ("#00FFFF", "#0066FF"),
+            ("#FF6F61", "#FF2E63"),
+            ("#FFC048", "#FF7F50"),
+            ("#9AECDB", "#55E6C1"),
+            ("#D6A2E8", "#C44569"),
+            ("#A3CB38", "#009432"),
+            ("#F5C469", "#FF9F1A"),
+        ]
+
+        # Построение столбцов с градиентом
+        bar_width = 0.6
+        x_positions = np.arange(len(x_labels))
+
+        # Определяем верхний предел для оси Y с отступом (10% выше максимума)
+        max_y = max(y_values) * 1.15  
+        ax.set_ylim(0, max_y)  
+
+        for i, (x, y) in enumerate(zip(x_positions, y_values)):
+            start_color, end_color = gradient_colors[i % len(gradient_colors)]
+            cmap = LinearSegmentedColormap.from_list(f"bar_{i}", [start_color, end_color])
+
+            # Создаем вертикальный градиент
+            gradient = np.linspace(0, 1, 256).reshape(256, 1)
+            ax.imshow(
+                gradient,
+                extent=(x - bar_width / 2, x + bar_width / 2, 0, y),
+                cmap=cmap,
+                aspect='auto',
+                zorder=2
+            )
+
+            # Значения над столбцами
+            ax.text(
+                x,
+                y + (max_y * 0.02),  # Отступ сверху для читаемости
+                f"{y}",
+                ha='center',
+                fontsize=12,
+                fontweight="bold",
+                color="white"
+            )
+
+        # Настройки осей и подписей
+        ax.set_xticks(x_positions)
+        ax.set_xticklabels(x_labels, fontsize=12, color='white', rotation=0) 
+        ax.set_title(title, fontsize=18, fontweight="bold", color="white", pad=20)
+        ax.set_xlabel(x_label, fontsize=14, fontweight="bold", color="white", labelpad=10)
+        ax.set_ylabel(y_label, fontsize=14, fontweight="bold", color="white", labelpad=10)
+
+        # Масштабирование по горизонтали с отступами
+        ax.set_xlim(-0.5, len(x_labels) - 0.5)
+
+        # Стилизация осей и сетки
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.spines['left'].set_color('white')
+        ax.spines['bottom'].set_color('white')
+        ax.grid(True, linestyle='--', alpha=0.5, color='gray')
+
+        plt.tight_layout()
+        plt.savefig(buffer, format='png', dpi=200)
+        plt.close(fig)
+
+    return buffer.getvalue()
+
+
+def measure(render, runs: int) -> tuple[list[float], list[int]]:
+    """
+    Замеряет время построения графиков и размер получившихся картинок.
+
+    :param render: Функция построения графика
+    :param runs: Количество графиков
+    :return: Время каждого графика в секундах и размеры картинок в байтах
+    """
+
+    # Первый график (импорт шрифтов, кэши matplotlib) не учитываем
+    render(*SAMPLES[0][:3], "Команды", "Количество вызовов")
+
+    timings = []
+    sizes = []
+    for i in range(runs):
+        title, x_labels, y_values = SAMPLES[i % len(SAMPLES)]
+        started = time.perf_counter()
+        image = render(title, x_labels, y_values, "Команды", "Количество вызовов")
+        timings.append(time.perf_counter() - started)
+        sizes.append(len(image))
+    return timings, sizes
+
+
+def report(name: str, timings: list[float], sizes: list[int]) -> None:
+    print(
+        f"{name}: медиана {statistics.median(timings) * 1000:.1f} мс, "
+        f"мин {min(timings) * 1000:.1f} мс, макс {max(timings) * 1000:.1f} мс, "
+        f"размер {statistics.mean(sizes) / 1024:.0f} КБ"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк построения графиков")
+    parser.add_argument("--runs", type=int, default=20, help="Количество графиков для каждого варианта")
+    parser.add_argument("--profiles", action="store_true", help="Сравнить профили рендеринга вместо реализаций")
+    args = parser.parse_args()
+
+    if args.profiles:
+        for name in CHART_PROFILES:
+            profile = profile_by_name(name)
+            timings, sizes = measure(lambda *chart: generate_bar_chart(*chart, profile), args.runs)
+            report(f"{name} ({profile.format}, {profile.dpi} dpi)", timings, sizes)
+        return
+
+    # Заготовку сравниваем с прежней реализацией при тех же 12x6 дюймов, 200 dpi, PNG
+    baseline_profile = RenderProfile(name="baseline")
+    for name, render in (
+        ("До (новая фигура)", generate_bar_chart_baseline),
+        ("После (заготовка)", lambda *chart: generate_bar_chart(*chart, baseline_profile)),
+    ):
+        report(name, *measure(render, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Бенчмарк запуска бота: время от старта `python main.py` до вызова dp.start_polling.
+Бот запускается в отдельном процессе с подмененными сетевыми вызовами
+(set_my_commands и start_polling), поэтому сеть не нужна. Пул графиков прогревается в фоне
+в процессах, которые импортируют main.py заново; на уровне модуля Bot не создается,
+поэтому токен в config.py на прогрев не влияет.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+# Стандартные библиотеки
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Код, который выполняется в процессе бота вместо `python main.py`
+CHILD = """
+import runpy, sys, time
+import config
+config.BOT_TOKEN = "123456:ABCdefGhIJKlmNoPQRsTUVwxyZ"  # Для Bot, создаваемого в main(): он проверяет формат токена
+
+from aiogram import Bot, Dispatcher
+
+async def set_my_commands(self, *args, **kwargs):
+    return True
+
+async def start_polling(self, *args, **kwargs):
+    print(f"START_POLLING {time.time()}", flush=True)
+    print(f"MATPLOTLIB {'matplotlib' in sys.modules}", flush=True)
+
+Bot.set_my_commands = set_my_commands
+Dispatcher.start_polling = start_polling
+runpy.run_path("main.py", run_name="__main__")
+"""
+
+
+def measure() -> tuple[float, bool]:
+    """
+    Запускает бота один раз.
+
+    :return: Секунды до вызова start_polling и был ли загружен matplotlib
+    """
+
+    started = time.time()
+    result = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True)
+    output = result.stdout
+
+    polling_at = None
+    matplotlib_loaded = None
+    for line in output.splitlines():
+        if line.startswith("START_POLLING "):
+            polling_at = float(line.split()[1])
+        elif line.startswith("MATPLOTLIB "):
+            matplotlib_loaded = line.split()[1] == "True"
+
+    if polling_at is None:
+        raise RuntimeError(f"Бот не дошел до start_polling:\n{output}\n{result.stderr}")
+    return polling_at - started, matplotlib_loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска бота")
+    parser.add_argument("--runs", type=int, default=5, help="Количество запусков")
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, matplotlib_loaded = measure()
+        timings.append(elapsed)
+
+    print(
+        f"До start_polling: медиана {statistics.median(timings) * 1000:.0f} мс, "
+        f"мин {min(timings) * 1000:.0f} мс, макс {max(timings) * 1000:.0f} мс, "
+        f"matplotlib загружен: {'да' if matplotlib_loaded else 'нет'}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+# Стандартные библиотеки
+import hashlib
+import sys
+import time
+from abc import ABC, abstractmethod
+from html import escape
+from collections import OrderedDict
+from typing import NamedTuple
+
+# Библиотеки сторонних разработчиков
+from sqlalchemy import select
+
+# Локальные модули
+from database import get_session
+from models import Command, RoleCommands, Topic, TopicCommands, Member, Team, member_team_table
+from config import MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL, CHART_CACHE_SIZE, CHART_CACHE_TTL
+
+
+class PreloadedIndex(ABC):
+    """
+    Базовый класс для индексов в памяти вида ключ -> набор имен (по умолчанию frozenset).
+    Индекс загружается целиком одним запросом и перестраивается после изменения данных,
+    поэтому проверки на каждую команду не обращаются к базе данных.
+    """
+
+    def __init__(self):
+        self._index: dict = {}
+        self._loaded = False
+        self._version = 0
+
+    @abstractmethod
+    async def _load(self, db) -> list[tuple]:
+        """
+        Возвращает пары (ключ, имя) для построения индекса.
+
+        :param db: Сессия базы данных
+        """
+
+    async def rebuild(self, db) -> None:
+        """
+        Загружает индекс из базы данных.
+
+        :param db: Сессия базы данных
+        """
+
+        version = self._version
+        rows = await self._load(db)
+
+        index: dict = {}
+        for key, name in rows:
+            names = index.setdefault(key, [])
+            if name is not None:
+                names.append(sys.intern(name))
+
+        self._index = {key: self._freeze(names) for key, names in index.items()}
+
+        # Если во время загрузки данные успели измениться, оставляем индекс "грязным"
+        self._loaded = version == self._version
+
+    def _freeze(self, names: list[str]):
+        """Превращает собранные для ключа имена в неизменяемое значение индекса."""
+        return frozenset(names)
+
+    def invalidate(self) -> None:
+        """Помечает индекс устаревшим, он будет перестроен при следующей проверке."""
+        self._version += 1
+        self._loaded = False
+
+    async def contains(self, db, key, command_name: str) -> bool:
+        """
+        Проверяет, есть ли команда в индексе для указанного ключа.
+
+        :param db: Сессия базы данных (используется только если индекс нужно перестроить)
+        :param key: Ключ индекса
+        :param command_name: Имя команды
+        :return: True, если команда есть в индексе
+        """
+
+        return command_name in await self.get(db, key, ())
+
+    async def get(self, db, key, default=None):
+        """
+        Возвращает значение индекса для ключа.
+
+        :param db: Сессия базы данных (используется только если индекс нужно перестроить)
+        :param key: Ключ индекса
+        :param default: Значение, если ключа нет в индексе
+        """
+
+        if not self._loaded:
+            await self.rebuild(db)
+        return self._index.get(key, default)
+
+    async def items(self, db) -> list[tuple]:
+        """
+        Возвращает все пары (ключ, значение) индекса.
+
+        :param db: Сессия базы данных (используется только если индекс нужно перестроить)
+        """
+
+        if not self._loaded:
+            await self.rebuild(db)
+        return list(self._index.items())
+
+
+class PermissionMatrix(PreloadedIndex):
+    """Матрица прав: role_id -> frozenset имен команд, доступных роли."""
+
+    async def _load(self, db) -> list[tuple]:
+        return (
+            await db.execute(
+                select(RoleCommands.role_id, Command.command_name)
+                .join(Command, Command.id == RoleCommands.command_id)
+            )
+        ).all()
+
+    async def has_command(self, db, role_id: int, command_name: str) -> bool:
+        """
+        Проверяет, доступна ли команда роли.
+
+        :param db: Сессия базы данных
+        :param role_id: ID роли
+        :param command_name: Имя команды
+        :return: True, если команда доступна роли
+        """
+        return await self.contains(db, role_id, command_name)
+
+
+class TopicIndex(PreloadedIndex):
+    """Список разрешенных команд по топикам: topic_name -> frozenset имен команд."""
+
+    async def _load(self, db) -> list[tuple]:
+        return (
+            await db.execute(
+                select(Topic.topic_name, Command.command_name)
+                .outerjoin(TopicCommands, TopicCommands.topic_id == Topic.id)
+                .outerjoin(Command, Command.id == TopicCommands.command_id)
+            )
+        ).all()
+
+    async def is_allowed(self, db, topic_name: str, command_name: str) -> bool:
+        """
+        Проверяет, разрешена ли команда в топике.
+
+        :param db: Сессия базы данных
+        :param topic_name: Название топика
+        :param command_name: Имя команды
+        :return: True, если команда разрешена в топике
+        """
+        return await self.contains(db, topic_name, command_name)
+
+
+class TeamSnapshot(NamedTuple):
+    """Участники команды: имена пользователей и готовые (экранированные) упоминания."""
+    usernames: tuple[str, ...]
+    mentions: tuple[str, ...]
+
+
+class TeamIndex(PreloadedIndex):
+    """Составы команд: team_name -> TeamSnapshot, в порядке добавления команд и участников."""
+
+    async def _load(self, db) -> list[tuple]:
+        return (
+            await db.execute(
+                select(Team.team_name, Member.username)
+                .outerjoin(member_team_table, member_team_table.c.team_id == Team.id)
+                .outerjoin(Member, Member.id == member_team_table.c.member_id)
+                .order_by(Team.id, Member.id)
+            )
+        ).all()
+
+    def _freeze(self, names: list[str]) -> TeamSnapshot:
+        return TeamSnapshot(
+            usernames=tuple(names),
+            mentions=tuple(escape(f"@{username}") for username in names),
+        )
+
+    async def get_team(self, db, team_name: str) -> TeamSnapshot | None:
+        """
+        Возвращает состав команды.
+
+        :param db: Сессия базы данных
+        :param team_name: Название команды
+        :return: Состав команды или None, если команды нет
+        """
+        return await self.get(db, team_name)
+
+
+class MemberSnapshot(NamedTuple):
+    """Компактный снимок пользователя, которого достаточно для проверки прав."""
+    id: int
+    telegram_id: int | None
+    username: str
+    role_id: int | None
+    role_level: int | None
+
+    @classmethod
+    def from_member(cls, member: Member) -> "MemberSnapshot":
+        role = member.role
+        return cls(
+            id=member.id,
+            telegram_id=member.telegram_id,
+            username=member.username,
+            role_id=member.role_id,
+            role_level=role.level if role else None,
+        )
+
+
+class MemberCache:
+    """
+    LRU-кэш снимков пользователей по Telegram ID с ограниченным временем жизни записей.
+    Позволяет не запрашивать пользователя и его роль из базы данных на каждую команду.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, MemberSnapshot]] = OrderedDict()
+        # Один username может временно принадлежать нескольким Telegram ID (например, после смены имени)
+        self._by_username: dict[str, set[int]] = {}
+
+    def get(self, telegram_id: int) -> MemberSnapshot | None:
+        """
+        Возвращает снимок пользователя, если он есть в кэше и не устарел.
+
+        :param telegram_id: Telegram ID пользователя
+        :return: Снимок пользователя или None
+        """
+
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            return None
+
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            self.invalidate(telegram_id)
+            return None
+
+        self._entries.move_to_end(telegram_id)
+        return snapshot
+
+    def put(self, telegram_id: int, snapshot: MemberSnapshot) -> None:
+        """
+        Сохраняет снимок пользователя, вытесняя самые давно использованные записи.
+
+        :param telegram_id: Telegram ID пользователя
+        :param snapshot: Снимок пользователя
+        """
+
+        self.invalidate(telegram_id)
+        self._entries[telegram_id] = (time.monotonic() + self.ttl, snapshot)
+        self._by_username.setdefault(snapshot.username, set()).add(telegram_id)
+
+        while len(self._entries) > self.maxsize:
+            oldest_id, (_, oldest) = self._entries.popitem(last=False)
+            self._forget_username(oldest.username, oldest_id)
+
+    def invalidate(self, telegram_id: int) -> None:
+        """Удаляет пользователя из кэша по Telegram ID."""
+        entry = self._entries.pop(telegram_id, None)
+        if entry is not None:
+            self._forget_username(entry[1].username, telegram_id)
+
+    def _forget_username(self, username: str, telegram_id: int) -> None:
+        telegram_ids = self._by_username.get(username)
+        if telegram_ids is not None:
+            telegram_ids.discard(telegram_id)
+            if not telegram_ids:
+                del self._by_username[username]
+
+    def invalidate_username(self, username: str) -> None:
+        """Удаляет из кэша всех пользователей с этим именем (например, после смены роли)."""
+        for telegram_id in list(self._by_username.get(username, ())):
+            self.invalidate(telegram_id)
+
+    def clear(self) -> None:
+        """Очищает кэш (например, после изменения уровней ролей)."""
+        self._entries.clear()
+        self._by_username.clear()
+
+
+class ChartCache:
+    """
+    Кэш отправленных графиков: ключ графика -> file_id картинки в Telegram.
+    Одинаковый график (те же заголовок и данные) отправляется повторно по file_id,
+    без построения и загрузки PNG. Записи живут ttl секунд, лишние вытесняются по LRU.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Строит ключ графика из его вида, периода и данных.
+
+        :param parts: Все, что влияет на картинку (заголовок, подписи, значения)
+        :return: Хэш данных графика
+        """
+        return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """
+        Возвращает file_id графика, если он есть в кэше и не устарел.
+
+        :param key: Ключ графика
+        :return: file_id или None
+        """
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, file_id = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return file_id
+
+    def put(self, key: str, file_id: str) -> None:
+        """
+        Сохраняет file_id отправленного графика.
+
+        :param key: Ключ графика
+        :param file_id: file_id картинки в Telegram
+        """
+
+        self._entries[key] = (time.monotonic() + self.ttl, file_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        """Удаляет график из кэша (например, если Telegram не принял file_id)."""
+        self._entries.pop(key, None)
+
+
+permission_matrix = PermissionMatrix()
+topic_index = TopicIndex()
+team_index = TeamIndex()
+member_cache = MemberCache(maxsize=MEMBER_CACHE_SIZE, ttl=MEMBER_CACHE_TTL)
+chart_cache = ChartCache(maxsize=CHART_CACHE_SIZE, ttl=CHART_CACHE_TTL)
+
+
+async def load_caches() -> None:
+    """Заполняет кэши при запуске бота."""
+    db = get_session()
+    try:
+        await permission_matrix.rebuild(db)
+        await topic_index.rebuild(db)
+        await team_index.rebuild(db)
+    finally:
+        await db.close()
@@ -0,0 +1,188 @@
+# Построение графиков статистики (matplotlib). Модуль импортируется только в процессах пула
+# графиков (см. charts.ChartRenderer) и в бенчмарках, сам бот его не загружает.
+
+# Стандартные библиотеки
+import io
+import os
+
+# Библиотеки сторонних разработчиков
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # Рендер без GUI
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.figure import Figure
+
+# Локальные модули
+from config import CHART_STYLE_PATH, CHART_PROFILES
+from charts import RenderProfile, get_profile, profile_by_name
+
+
+# Параметры стиля графиков, разобранные из файла один раз на процесс
+_style: dict | None = None
+
+
+def load_style() -> dict:
+    """
+    Загружает стиль графиков из файла в словарь rcParams. Файл читается один раз на процесс,
+    дальше стиль применяется к каждому графику из памяти.
+    Если файл стиля недоступен, используется встроенный темный стиль matplotlib.
+
+    :return: Словарь rcParams стиля
+    """
+
+    global _style
+    if _style is not None:
+        return _style
+
+    path = CHART_STYLE_PATH
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+    try:
+        style = dict(matplotlib.rc_params_from_file(path, fail_on_error=True, use_default_template=False))
+    except Exception as e:
+        print(f"Ошибка загрузки стиля графиков: {e}")
+        style = dict(plt.style.library["dark_background"])
+
+    style["font.family"] = "DejaVu Sans"  # Поддержка кириллицы и эмодзи
+    _style = style
+    return _style
+
+
+# Цветовые пары для градиентов столбцов
+GRADIENT_COLORS = [
+    ("#00FFFF", "#0066FF"),
+    ("#FF6F61", "#FF2E63"),
+    ("#FFC048", "#FF7F50"),
+    ("#9AECDB", "#55E6C1"),
+    ("#D6A2E8", "#C44569"),
+    ("#A3CB38", "#009432"),
+    ("#F5C469", "#FF9F1A"),
+]
+
+# Вертикальный градиент, общий для всех столбцов (цвет задается colormap)
+GRADIENT = np.linspace(0, 1, 256).reshape(256, 1)
+
+BAR_WIDTH = 0.6
+
+
+class BarChartTemplate:
+    """
+    Заготовка столбчатого графика: фигура, оси, оформление и colormap создаются один раз на процесс.
+    Для каждого графика обновляются только границы столбцов, подписи значений, метки и заголовки.
+    Столбцы и подписи переиспользуются, лишние скрываются.
+    """
+
+    def __init__(self, style: dict):
+        self.style = style
+        self.colormaps = [
+            LinearSegmentedColormap.from_list(f"bar_{i}", [start_color, end_color])
+            for i, (start_color, end_color) in enumerate(GRADIENT_COLORS)
+        ]
+
+        with plt.rc_context(style):
+            # Фигура без pyplot: она живет все время работы процесса и не попадает в список открытых фигур
+            self.fig = Figure(figsize=(12, 6))
+            FigureCanvasAgg(self.fig)
+            self.ax = self.fig.add_subplot()
+
+            # Стилизация осей и сетки
+            ax = self.ax
+            ax.spines['top'].set_visible(False)
+            ax.spines['right'].set_visible(False)
+            ax.spines['left'].set_color('white')
+            ax.spines['bottom'].set_color('white')
+            ax.grid(True, linestyle='--', alpha=0.5, color='gray')
+
+        self._bars: list = []  # Пары (градиент столбца, подпись значения)
+
+    def _bar(self, i: int) -> tuple:
+        """Возвращает i-й столбец, создавая недостающие."""
+        while len(self._bars) <= i:
+            n = len(self._bars)
+            image = self.ax.imshow(
+                GRADIENT,
+                extent=(0, 1, 0, 1),
+                cmap=self.colormaps[n % len(self.colormaps)],
+                aspect='auto',
+                zorder=2
+            )
+            label = self.ax.text(0, 0, "", ha='center', fontsize=12, fontweight="bold", color="white")
+            self._bars.append((image, label))
+        return self._bars[i]
+
+    def render(self, title, x_labels, y_values, x_label, y_label, profile: RenderProfile) -> bytes:
+        """
+        Обновляет заготовку данными графика и рендерит ее в картинку по профилю.
+
+        :return: Картинка графика в формате профиля
+        """
+
+        ax = self.ax
+        with plt.rc_context(self.style):
+            # Определяем верхний предел для оси Y с отступом (10% выше максимума)
+            max_y = max(y_values) * 1.15
+
+            x_positions = np.arange(len(x_labels))
+            for i, (x, y) in enumerate(zip(x_positions, y_values)):
+                image, label = self._bar(i)
+                image.set_extent((x - BAR_WIDTH / 2, x + BAR_WIDTH / 2, 0, y))
+                image.set_visible(True)
+
+                # Значения над столбцами (отступ сверху для читаемости)
+                label.set_position((x, y + (max_y * 0.02)))
+                label.set_text(f"{y}")
+                label.set_visible(True)
+
+            for image, label in self._bars[len(x_labels):]:
+                image.set_visible(False)
+                label.set_visible(False)
+
+            # Настройки осей и подписей
+            ax.set_ylim(0, max_y)
+            ax.set_xlim(-0.5, len(x_labels) - 0.5)  # Масштабирование по горизонтали с отступами
+            ax.set_xticks(x_positions)
+            ax.set_xticklabels(x_labels, fontsize=12, color='white', rotation=0)
+            ax.set_title(title, fontsize=18, fontweight="bold", color="white", pad=20)
+            ax.set_xlabel(x_label, fontsize=14, fontweight="bold", color="white", labelpad=10)
+            ax.set_ylabel(y_label, fontsize=14, fontweight="bold", color="white", labelpad=10)
+
+            buffer = io.BytesIO()
+            self.fig.set_size_inches(profile.figsize)
+            self.fig.tight_layout()
+            self.fig.savefig(buffer, format=profile.format, dpi=profile.dpi, pil_kwargs=profile.pil_kwargs())
+
+        return buffer.getvalue()
+
+
+# Заготовка графика текущего процесса
+_template: BarChartTemplate | None = None
+
+
+def _get_template() -> BarChartTemplate:
+    global _template
+    if _template is None:
+        _template = BarChartTemplate(load_style())
+    return _template
+
+
+def warm_up() -> int:
+    """Прогревает процесс пула: стиль, шрифты, заготовка графика и рендерер готовы до первого графика."""
+    for name in CHART_PROFILES:
+        generate_bar_chart("Прогрев", ["/warm_up"], [1], "Команды", "Количество вызовов", profile_by_name(name))
+    return os.getpid()
+
+
+def generate_bar_chart(title, x_labels, y_values, x_label, y_label, profile: RenderProfile | None = None) -> bytes:
+    """
+    Генерирует столбчатый график с индивидуальным градиентом для каждого столбца.
+    Рендерит график в памяти по профилю (размер, dpi, формат) и возвращает байты картинки
+    (на диск ничего не пишется).
+    Выполняется в процессе пула (см. ChartRenderer), а не в event loop бота.
+    """
+    if not x_labels or not y_values:
+        raise ValueError("Нет данных для построения графика")
+
+    return _get_template().render(title, x_labels, y_values, x_label, y_label, profile or get_profile())
@@ -0,0 +1,162 @@
+# Стандартные библиотеки
+import asyncio
+import multiprocessing
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Локальные модули
+from config import CHART_WORKERS, CHART_QUEUE_SIZE, CHART_TIMEOUT, CHART_PROFILES, CHART_DEFAULT_PROFILE, CHART_PROFILE_BY_KIND
+
+
+class ChartQueueFull(Exception):
+    """Очередь на построение графиков переполнена."""
+
+
+class RenderProfile(NamedTuple):
+    """Параметры рендеринга графика: размер, разрешение и кодирование картинки."""
+    name: str
+    figsize: tuple[float, float] = (12, 6)
+    dpi: int = 200
+    format: str = "png"  # png, jpeg или webp (через Pillow)
+    compress_level: int = 6  # Сжатие png (0-9)
+    quality: int = 90  # Качество jpeg/webp (1-100)
+
+    @property
+    def extension(self) -> str:
+        return "jpg" if self.format == "jpeg" else self.format
+
+    def pil_kwargs(self) -> dict:
+        """Параметры сохранения картинки для Pillow."""
+        if self.format == "png":
+            return {"compress_level": self.compress_level}
+        return {"quality": self.quality}
+
+
+def profile_by_name(name: str) -> RenderProfile:
+    """
+    Возвращает профиль рендеринга по имени (см. CHART_PROFILES в config.py).
+
+    :param name: Имя профиля, например "webp"
+    :return: Профиль рендеринга
+    """
+    return RenderProfile(name=name, **CHART_PROFILES[name])
+
+
+def get_profile(kind: str | None = None) -> RenderProfile:
+    """
+    Возвращает профиль рендеринга для вида графика (см. CHART_PROFILE_BY_KIND в config.py).
+
+    :param kind: Вид графика, например "top_commands"
+    :return: Профиль рендеринга
+    """
+    return profile_by_name(CHART_PROFILE_BY_KIND.get(kind, CHART_DEFAULT_PROFILE))
+
+
+# Функции, которые выполняются в процессах пула. matplotlib и numpy импортируются только там
+# (модуль chart_render), поэтому бот запускается без загрузки графического стека
+
+def _init_worker() -> None:
+    from chart_render import load_style
+    load_style()
+
+
+def _warm_up_worker() -> int:
+    from chart_render import warm_up
+    return warm_up()
+
+
+def _render_in_worker(*args) -> bytes:
+    from chart_render import generate_bar_chart
+    return generate_bar_chart(*args)
+
+
+class ChartRenderer:
+    """
+    Пул процессов для построения графиков. Процессы запускаются и прогреваются в фоне при старте бота,
+    поэтому построение графика не блокирует event loop и не тратит время на импорт matplotlib.
+    Количество графиков в работе ограничено max_pending, а ожидание результата - timeout секундами.
+    """
+
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._warm_up_task: asyncio.Task | None = None
+        self._pending = 0
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn: процессы не наследуют потоки и соединения с базой данных от бота
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        return self._executor
+
+    def start(self) -> None:
+        """Запускает процессы пула и их прогрев в фоне, не задерживая запуск бота."""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self._warm_up())
+
+    async def _warm_up(self) -> None:
+        executor = self._executor or self._create_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, _warm_up_worker) for _ in range(self.workers)))
+        except Exception as e:
+            print(f"Ошибка прогрева пула графиков: {e}")
+
+    def stop(self) -> None:
+        """Останавливает пул, отменяя графики, которые еще не начали строиться."""
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            self._warm_up_task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def render(self, title, x_labels, y_values, x_label, y_label, profile: RenderProfile) -> bytes:
+        """
+        Строит столбчатый график в процессе пула.
+
+        :raises ChartQueueFull: Если в работе уже max_pending графиков
+        :raises asyncio.TimeoutError: Если график не построился за timeout секунд
+        :raises BrokenProcessPool: Если процесс пула упал
+        :return: Картинка графика в формате профиля
+        """
+
+        if self._pending >= self.max_pending:
+            raise ChartQueueFull()
+
+        executor = self._executor or self._create_executor()
+        try:
+            future = executor.submit(_render_in_worker, title, x_labels, y_values, x_label, y_label, profile)
+            self._pending += 1
+
+            # Место в очереди освобождается, только когда процесс действительно закончил график
+            # (или график отменен до начала), а не когда вышло время ожидания
+            result = asyncio.wrap_future(future)
+            result.add_done_callback(self._release)
+            try:
+                return await asyncio.wait_for(asyncio.shield(result), self.timeout)
+            except asyncio.TimeoutError:
+                # Если график еще не начал строиться, он не займет процесс
+                future.cancel()
+                raise
+        except BrokenProcessPool:
+            # Процесс пула упал - закрываем пул, новый создастся при следующем графике
+            if self._executor is executor:
+                self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def _release(self, result: asyncio.Future) -> None:
+        self._pending -= 1
+        # Забираем ошибку графика, который уже никто не ждет, чтобы asyncio не ругался на нее
+        if not result.cancelled():
+            result.exception()
+
+
+chart_renderer = ChartRenderer(workers=CHART_WORKERS, max_pending=CHART_QUEUE_SIZE, timeout=CHART_TIMEOUT)
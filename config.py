@@ -1,9 +1,88 @@
 # Токен бота
 BOT_TOKEN = "ваш_токен"
 
+# HTTP-сессия бота для запросов к Bot API: максимум одновременных соединений,
+# сколько секунд держать простаивающее соединение открытым и таймаут запроса (в секундах)
+BOT_HTTP_CONNECTION_LIMIT = 100
+BOT_HTTP_KEEPALIVE_TIMEOUT = 60
+BOT_HTTP_TIMEOUT = 30
+
+# Лимиты исходящих сообщений (сообщений в секунду и сколько можно отправить подряд):
+# общий для бота, для личного чата и для группы. Telegram допускает ~30 сообщений в секунду всего,
+# ~1 в секунду в личный чат и ~20 в минуту в группу. Лимиты чата применяются только к массовой
+# рассылке (продолжения /tag, уведомления /notify), обычные ответы соблюдают только общий лимит
+SEND_GLOBAL_RATE = 30
+SEND_GLOBAL_BURST = 30
+SEND_PRIVATE_RATE = 1
+SEND_PRIVATE_BURST = 3
+SEND_GROUP_RATE = 20 / 60
+SEND_GROUP_BURST = 5
+# Сколько раз повторять сообщение после TelegramRetryAfter и сколько секунд может ждать обычный ответ
+# (если Telegram просит ждать дольше, ошибка возвращается хендлеру сразу)
+SEND_MAX_RETRIES = 3
+SEND_MAX_WAIT = 10
+
 # Путь к базе данных
 DB_PATH = "bot_database.db"
 
+# Использовать асинхронный драйвер базы данных (aiosqlite)
+# Если False, запросы выполняются через синхронный драйвер в пуле потоков
+DB_ASYNC = True
+
+# Кэш пользователей по Telegram ID: максимальное количество записей и время жизни записи (в секундах)
+MEMBER_CACHE_SIZE = 1000
+MEMBER_CACHE_TTL = 300
+
+# Отложенная запись истории команд: размер пачки, максимальная задержка записи (мс) и размер очереди
+HISTORY_BATCH_SIZE = 100
+HISTORY_FLUSH_INTERVAL_MS = 500
+HISTORY_QUEUE_SIZE = 10000
+
+# Архивация истории команд: записи старше HISTORY_RETENTION_DAYS дней переносятся в сжатые
+# помесячные CSV файлы в HISTORY_ARCHIVE_DIR и удаляются из базы пачками по HISTORY_ARCHIVE_CHUNK_SIZE
+HISTORY_RETENTION_DAYS = 90
+HISTORY_ARCHIVE_DIR = "archive"
+HISTORY_ARCHIVE_CHUNK_SIZE = 1000
+
+# Пул процессов для построения графиков: количество процессов, сколько графиков может
+# ожидать построения одновременно и сколько секунд ждать один график
+CHART_WORKERS = 2
+CHART_QUEUE_SIZE = 8
+CHART_TIMEOUT = 15
+
+# Профили рендеринга графиков: размер (в дюймах), dpi, формат (png, jpeg или webp) и параметры сжатия
+# (compress_level 0-9 для png, quality 1-100 для jpeg/webp). Telegram все равно пережимает фото
+# и уменьшает их до 1280 пикселей по большей стороне, поэтому 200 dpi нужны только для "hd"
+CHART_PROFILES = {
+    "hd": {"figsize": (12, 6), "dpi": 200, "format": "png", "compress_level": 6},
+    "standard": {"figsize": (12, 6), "dpi": 105, "format": "png", "compress_level": 1},
+    "jpeg": {"figsize": (12, 6), "dpi": 105, "format": "jpeg", "quality": 90},
+    "webp": {"figsize": (12, 6), "dpi": 105, "format": "webp", "quality": 90},
+}
+
+# Профиль для каждого вида графика (остальные графики строятся с профилем CHART_DEFAULT_PROFILE)
+CHART_DEFAULT_PROFILE = "standard"
+CHART_PROFILE_BY_KIND = {
+    "top_commands": "standard",
+    "top_users_handler": "standard",
+    "top_users": "standard",
+    "top_casino_winners": "jpeg",
+    "top_casino_winners_alltime": "jpeg",
+}
+
+# Кэш отправленных графиков (file_id в Telegram): максимальное количество и время жизни записи (в секундах)
+CHART_CACHE_SIZE = 256
+CHART_CACHE_TTL = 600
+
+# Список команд (/teams): сколько команд показывать на одной странице
+TEAMS_PAGE_SIZE = 10
+
+# Отложенные уведомления (/notify): часовой пояс, в котором пользователи указывают время,
+# сколько ближайших уведомлений держать в памяти и через сколько секунд повторить отправку после ошибки
+NOTIFY_TIMEZONE = "Europe/Moscow"
+NOTIFY_WINDOW_SIZE = 500
+NOTIFY_RETRY_DELAY = 60
+
 # ID чатов, где бот должен работать
 # Список разрешенных чатов для работы бота
 ALLOWED_CHAT_IDS = [-100312321321, 5010809124]
@@ -20,5 +99,6 @@ EMOJI_IDS = [
     "CAACAgIAAxkBAAENiXpnjSZhyrmSgjyq6-1YRgOEj1p3AwAC82AAAodRQEmc10gts7CCxDYE"
 ]
 
-# Стиль графиков статистики
-STYLE_URL = "https://github.com/dhaitz/matplotlib-stylesheets/raw/master/pitayasmoothie-dark.mplstyle"
\ No newline at end of file
+# Стиль графиков статистики (путь к .mplstyle файлу, относительный путь считается от папки бота)
+# Собственный стиль бота в styles/; оригинальная тема pitayasmoothie-dark больше не скачивается
+CHART_STYLE_PATH = "styles/stats-dark.mplstyle"
\ No newline at end of file
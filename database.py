@@ -1,15 +1,20 @@
 # Стандартные библиотеки
+import asyncio
 
 # Библиотеки сторонних разработчиков
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
 
 # Локальные модули
-from models import Base, Team, Member
+from models import Base
+from config import DB_ASYNC
 
 
 # Подключение к базе данных (поменяйте путь на ваш)
 DATABASE_URL = "sqlite:///./bot_database.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./bot_database.db"
 
 # Инициализация базы данных
 engine = create_engine(DATABASE_URL)
@@ -17,6 +22,104 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base.metadata.create_all(bind=engine)
 
+# Асинхронный движок (aiosqlite) для хендлеров, включается через DB_ASYNC в config.py
+async_engine = create_async_engine(ASYNC_DATABASE_URL) if DB_ASYNC else None
+AsyncSessionLocal = (
+    async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    if DB_ASYNC else None
+)
+
+# Синхронные сессии для режима без aiosqlite: объекты не должны "протухать" после commit,
+# иначе обращение к атрибутам снова пойдет в базу уже из event loop.
+# Без пула соединений: иначе при всплеске команд потоки ждут соединения, которые держат
+# сессии, ожидающие свободного потока, и все встает до таймаута пула
+thread_engine = create_engine(DATABASE_URL, poolclass=NullPool)
+SyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=thread_engine)
+
+
+class SyncSessionAdapter:
+    """
+    Асинхронная обертка над синхронной Session с тем же интерфейсом, что и у AsyncSession.
+    Каждый запрос выполняется в пуле потоков, поэтому event loop не блокируется даже без aiosqlite.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def execute(self, statement, *args, **kwargs):
+        result = await asyncio.to_thread(self.sync_session.execute, statement, *args, **kwargs)
+        # Буферизуем строки в потоке, чтобы чтение результата не ходило в базу из event loop
+        try:
+            return result.freeze()()
+        except NotImplementedError:
+            # Результат без строк (например, bulk insert через ORM)
+            return result
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await asyncio.to_thread(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def scalars(self, statement, *args, **kwargs):
+        result = await self.execute(statement, *args, **kwargs)
+        return result.scalars()
+
+    async def get(self, entity, ident, **kwargs):
+        return await asyncio.to_thread(self.sync_session.get, entity, ident, **kwargs)
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    async def delete(self, instance) -> None:
+        await asyncio.to_thread(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await asyncio.to_thread(self.sync_session.flush)
+
+    async def refresh(self, instance, *args, **kwargs) -> None:
+        await asyncio.to_thread(self.sync_session.refresh, instance, *args, **kwargs)
+
+    async def commit(self) -> None:
+        await asyncio.to_thread(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await asyncio.to_thread(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, self.sync_session, *args, **kwargs)
+
+
+def get_session() -> AsyncSession | SyncSessionAdapter:
+    """
+    Возвращает сессию базы данных для хендлеров.
+    В зависимости от DB_ASYNC это AsyncSession поверх aiosqlite или синхронная сессия в пуле потоков.
+    Интерфейс у обоих вариантов одинаковый: запросы и commit выполняются через await.
+
+    :return: Асинхронная сессия базы данных
+    """
+
+    if DB_ASYNC:
+        return AsyncSessionLocal()
+    return SyncSessionAdapter(SyncSessionLocal())
+
+
+async def close_database() -> None:
+    """Закрывает пулы соединений с базой данных при остановке бота."""
+    if async_engine is not None:
+        await async_engine.dispose()
+    thread_engine.dispose()
+    engine.dispose()
+
 
 # def get_db():
 #     db = SessionLocal()
@@ -25,9 +128,3 @@ Base.metadata.create_all(bind=engine)
 #     finally:
 #         db.close()
 
-
-def get_team_members(db, team_name: str):
-    team = db.query(Team).filter(Team.team_name == team_name).first()
-    if team:
-        return team.members
-    return []
@@ -2,25 +2,29 @@
 import random
 import time
 import asyncio
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 # Библиотеки сторонних разработчиков
 from aiogram import types
-from aiogram.types import Message, PreCheckoutQuery, LabeledPrice
+from aiogram.types import Message, PreCheckoutQuery, LabeledPrice, CallbackQuery
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
 from html import escape
-from sqlalchemy.sql import func
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
 
 # Локальные модули
-from database import get_team_members, SessionLocal
-from models import CasinoWin, Team, Member, Role, Command, RoleCommands, Topic, TopicCommands, CommandHistory
-from config import BOT_TOKEN, EMOJI_IDS
-from utils import check_user_and_permissions, get_top5_casino_winners_all_time, get_top5_casino_winners_this_week, parse_quoted_argument, choice, delete_user_message, extract_command_name, send_chart, get_score_change, generate_notification_message
+from database import get_session
+from models import Team, Member, Role, Command, RoleCommands, Topic, TopicCommands, member_team_table
+from config import EMOJI_IDS
+from utils import check_user_and_permissions, debit_balance, credit_balance, credit_winnings, get_targets_by_username, set_members_role, get_top5_casino_winners_all_time, get_top5_casino_winners_this_week, get_top_commands, get_top_users, get_top_users_for_command, parse_quoted_argument, split_mentions, format_teams_page, MESSAGE_TEXT_LIMIT, MESSAGE_CAPTION_LIMIT, choice, delete_user_message, send_chart, get_score_change
 from keyboards.payment_keyboard import payment_keyboard
-
-
-bot = Bot(token=BOT_TOKEN)
+from keyboards.teams_keyboard import teams_keyboard, TEAMS_PAGE_PREFIX
+from cache import permission_matrix, topic_index, member_cache, team_index
+from history import utc_now
+from sender import bulk_send
+from notifications import notification_dispatcher, parse_notify_time, format_notify_time
 
 
 async def add_team_command(message: Message):
@@ -31,7 +35,7 @@ async def add_team_command(message: Message):
     :return: Ответ в чат о результате добавления команды.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Нормализация текста команды
     raw_text = message.text or message.caption or ""
@@ -43,29 +47,30 @@ async def add_team_command(message: Message):
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/add_team'):
-        db.close()
+        await db.close()
         return
 
     # Валидация
     if not team_name:
         await message.reply('Использование: /add_team "<Название команды>"')
-        db.close()
+        await db.close()
         return
 
     # Проверка, существует ли уже команда с таким именем
-    existing_team = db.query(Team).filter(Team.team_name == team_name).first()
+    existing_team = await db.scalar(select(Team).where(Team.team_name == team_name))
 
     if existing_team:
         await message.reply(f"Команда '{team_name}' уже существует.")
-        db.close()
+        await db.close()
         return
 
     # Создаем новую команду
     new_team = Team(team_name=team_name)
     db.add(new_team)
-    db.commit()
+    await db.commit()
+    team_index.invalidate()
 
-    db.close()
+    await db.close()
 
     await message.answer(f"Команда '{team_name}' успешно добавлена.")
 
@@ -78,11 +83,11 @@ async def add_member_command(message: Message):
     Обрабатывает команду для добавления пользователей в команду (/add_member). Пользователи могут состоять сразу в нескольких командах.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/add_member'):
-        db.close()
+        await db.close()
         return
 
     # Нормализация текста команды
@@ -93,57 +98,77 @@ async def add_member_command(message: Message):
 
     if not team_name:
         await message.reply('Использование: /add_member "<Название команды>" user1 user2 ...')
-        db.close()
+        await db.close()
         return
 
     if not remainder:
         await message.reply('Укажите хотя бы одного пользователя: /add_member "Название команды" user1 user2 ...')
-        db.close()
+        await db.close()
         return
 
-    usernames = remainder.split()
-    team = db.query(Team).filter(Team.team_name == team_name).first()
+    # Убираем символ @ и повторы, сохраняя порядок
+    usernames = list(dict.fromkeys(username.lstrip('@') for username in remainder.split()))
+    team = await db.scalar(select(Team).where(Team.team_name == team_name))
 
     if not team:
         await message.reply(f"Команда '{team_name}' не найдена.")
-        db.close()
+        await db.close()
         return
 
+    # Находим всех уже известных пользователей одним запросом
+    member_ids = {}
+    for username, member_id in await db.execute(
+        select(Member.username, Member.id).where(Member.username.in_(usernames)).order_by(Member.id)
+    ):
+        member_ids.setdefault(username, member_id)
+
+    # И тех из них, кто уже состоит в команде
+    already_in_team_ids = set(
+        await db.scalars(
+            select(member_team_table.c.member_id)
+            .where(member_team_table.c.team_id == team.id, member_team_table.c.member_id.in_(member_ids.values()))
+        )
+    )
+
+    # Создаем недостающих пользователей с ролью по умолчанию
+    missing_usernames = [username for username in usernames if username not in member_ids]
+    if missing_usernames:
+        default_role = await db.scalar(select(Role).where(Role.role_name == 'default_user'))
+        if not default_role:
+            default_role = Role(role_name='default_user')
+            db.add(default_role)
+            await db.flush()
+
+        # Один executemany без RETURNING (с RETURNING SQLite вставляет строки по одной), затем забираем ID
+        await db.execute(
+            insert(Member),
+            [{"username": username, "role_id": default_role.id} for username in missing_usernames],
+        )
+        member_ids.update(
+            (await db.execute(select(Member.username, Member.id).where(Member.username.in_(missing_usernames)))).all()
+        )
+
     added_users = []
     already_in_team_users = []
-
     for username in usernames:
-        username_without_at = username.lstrip('@')
-        existing_user = db.query(Member).filter(Member.username == username_without_at).first()
-
-        if existing_user:
-            # Проверяем, состоит ли пользователь в команде
-            if team not in existing_user.teams:
-                # Если пользователь еще не в этой команде, добавляем
-                existing_user.teams.append(team)
-                added_users.append(f"@{username_without_at}")
-            else:
-                already_in_team_users.append(f"@{username_without_at}")
+        if member_ids[username] in already_in_team_ids:
+            already_in_team_users.append(f"@{username}")
         else:
-            # Создаем нового пользователя
-            new_user = Member(username=username_without_at)
-
-            # Назначаем роль по умолчанию
-            default_role = db.query(Role).filter(Role.role_name == 'default_user').first()
-            if not default_role:
-                default_role = Role(role_name='default_user')
-                db.add(default_role)
-                db.commit()
+            added_users.append(f"@{username}")
 
-            new_user.role_id = default_role.id
-            db.add(new_user)
-            db.commit()
-
-            # Добавляем пользователя в команду
-            new_user.teams.append(team)
-            added_users.append(f"@{username_without_at}")
+    # Добавляем связи с командой одним запросом; связи, которые уже есть, пропускаются
+    if added_users:
+        await db.execute(
+            sqlite_insert(member_team_table).on_conflict_do_nothing(),
+            [
+                {"member_id": member_ids[username], "team_id": team.id}
+                for username in usernames
+                if member_ids[username] not in already_in_team_ids
+            ],
+        )
 
-    db.commit()
+    await db.commit()
+    team_index.invalidate()
 
     # Формируем ответ
     response_message = ""
@@ -157,7 +182,7 @@ async def add_member_command(message: Message):
     if not added_users and not already_in_team_users:
         response_message = f"❌ Не удалось добавить пользователей в команду '{team_name}'."
 
-    db.close()
+    await db.close()
 
     await message.answer(response_message)
 
@@ -173,11 +198,11 @@ async def remove_team_command(message: Message):
     :return: Ответ в чат с результатами удаления команды.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/remove_team'):
-        db.close()
+        await db.close()
         return
 
     # Нормализация текста команды
@@ -188,14 +213,15 @@ async def remove_team_command(message: Message):
 
     if not team_name:
         await message.reply('Использование: /remove_team "<Название команды>"')
-        db.close()
+        await db.close()
         return
 
-    team = db.query(Team).filter(Team.team_name == team_name).first()
+    team = await db.scalar(select(Team).where(Team.team_name == team_name))
 
     if team:
-        db.delete(team)
-        db.commit()
+        await db.delete(team)
+        await db.commit()
+        team_index.invalidate()
         await message.answer(f"Команда '{team_name}' успешно удалена.")
 
         # Удаляем сообщение пользователя после успешной обработки
@@ -204,97 +230,23 @@ async def remove_team_command(message: Message):
         await message.reply(f"Команда '{team_name}' не найдена.")
 
 
-    db.close()
-
+    await db.close()
 
-async def remove_member_command(message: Message):
-    """
-    Обрабатывает команду для удаления пользователей из команды (/remove_member). Проверяет существование команды и наличие пользователей в ней, затем удаляет пользователей.
 
-    :param message: Сообщение от пользователя, содержащее команду, название команды и список пользователей для удаления.
-    :return: Ответ в чат с результатами удаления пользователей из команды.
-    """
-
-    db = SessionLocal()
-
-    # Проверяем пользователя, чат и разрешение команды
-    if not await check_user_and_permissions(db, message, '/remove_member'):
-        db.close()
-        return
-
-    # Нормализация текста команды
-    raw_text = message.text or message.caption or ""
-
-    # Парсинг аргументов
-    operation, team_name, remainder = parse_quoted_argument(raw_text, "remove_member")
-
-    if not team_name:
-        await message.reply('Использование: /remove_member "<Название команды>" user1 user2 ...')
-        db.close()
-        return
-
-    usernames = remainder.split()
-
-    team = db.query(Team).filter(Team.team_name == team_name).first()
-
-    if not team:
-        await message.reply(f"Команда '{team_name}' не найдена.")
-        return
-
-    removed_users = []
-    not_found_users = []
-
-    for username in usernames:
-        # Убираем символ @, если он есть
-        username_without_at = username.lstrip('@')
-
-        # Проверяем, есть ли пользователь в команде
-        user_in_team = (db.query(Member).join(Member.teams).filter(Team.id == team.id,Member.username == username_without_at).first())
-
-        print(user_in_team)
-
-        if user_in_team:
-            # Устанавливаем NULL в поле team_id, удаляя пользователя из команды
-            user_in_team.team_id = None
-            removed_users.append(f"@{username_without_at}")  # Приписываем @
-        else:
-            not_found_users.append(f"@{username_without_at}")  # Приписываем @
-
-    db.commit()
-
-    # Формируем сообщение для пользователя
-    response_message = ""
-
-    if removed_users:
-        response_message += f"🗑️ Пользователи {', '.join(removed_users)} удалены из команды '{team_name}'.\n\n"
-
-    if not_found_users:
-        response_message += f"🔎 Пользователи {', '.join(not_found_users)} не найдены в команде '{team_name}'."
-
-    if not removed_users and not not_found_users:
-        response_message = f"Не удалось удалить пользователей из команды '{team_name}'."  # Пишем, если не было изменений
-
-    db.close()
-
-    await message.answer(response_message)
-
-    # Удаляем сообщение пользователя после успешной обработки
-    await delete_user_message(message)
-
-
-async def tag_command(message: Message):
+async def tag_command(message: Message, bot: Bot):
     """
     Обрабатывает команду для отправки тега с упоминанием участников команды и отправителя (/tag). Формирует сообщение с упоминанием и текстом.
 
     :param message: Сообщение от пользователя, содержащее команду, название команды и текст для тега.
+    :param bot: Общий экземпляр бота (передается диспетчером).
     :return: Ответ в чат с тегом, упоминанием участников и отправителя, с возможностью отправки медиа.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение
     if not await check_user_and_permissions(db, message, '/tag'):
-        db.close()
+        await db.close()
         return
 
     team_name = None
@@ -311,7 +263,7 @@ async def tag_command(message: Message):
 
     if not full_text:
         await message.reply('Использование: /tag "<Название команды>" [-no-author] <текст>')
-        db.close()
+        await db.close()
         return
 
     # Парсинг аргументов
@@ -319,7 +271,7 @@ async def tag_command(message: Message):
 
     if not team_name:
         await message.reply('Использование: /remove_team "<Название команды>"')
-        db.close()
+        await db.close()
         return
 
     # 3) Проверяем флаг -no-author (если он в начале остатка)
@@ -330,13 +282,13 @@ async def tag_command(message: Message):
     # Остаток считаем пользовательским сообщением (HTML/текст)
     custom_message = remainder
 
-    members = get_team_members(db, team_name)
-    if not members:
+    # Состав команды берется из кэша (см. TeamIndex в cache.py)
+    team = await team_index.get_team(db, team_name)
+    if not team or not team.usernames:
         await message.reply(f"Команда '{team_name}' не найдена или не имеет участников.")
-        db.close()
+        await db.close()
         return
 
-    mentions = " ".join([f"@{member.username}" for member in members])
     sender = (
         f"Команду вызвал(а): @{message.from_user.username}"
         if message.from_user.username
@@ -349,15 +301,21 @@ async def tag_command(message: Message):
     # ВАЖНО: если вы хотите сохранить сложную HTML-разметку из custom_message – не экранируем его.
     # Но team_name, mentions и sender лучше экранировать
     team_name_escaped = escape(team_name)
-    mentions_escaped = escape(mentions)
     sender_escaped = escape(sender)
 
-    formatted_message = (
+    header = (
         f"<blockquote>Для команды #{team_name_escaped}</blockquote>\n\n"
         f"{custom_message}\n\n"
-        f"<i>{mentions_escaped}</i>\n"
-        f"<i>{sender_escaped}</i>"
     )
+    footer = f"\n<i>{sender_escaped}</i>"
+
+    # Упоминания, которые не помещаются в первое сообщение (лимит текста или подписи к медиа),
+    # отправляются следующими сообщениями. Длина считается по HTML, поэтому с запасом
+    limit = MESSAGE_CAPTION_LIMIT if (message.photo or message.document or message.audio) else MESSAGE_TEXT_LIMIT
+    first_limit = max(0, limit - len(header) - len(footer) - len("<i></i>"))
+    mention_chunks = split_mentions(team.mentions, first_limit, MESSAGE_TEXT_LIMIT - len("<i></i>"))
+
+    formatted_message = header + f"<i>{mention_chunks[0]}</i>" + footer
 
     # Удаляем исходное сообщение (как и прежде)
     try:
@@ -413,7 +371,17 @@ async def tag_command(message: Message):
             message_thread_id=message.message_thread_id
         )
 
-    db.close()
+    await db.close()
+
+    # Остальные упоминания - массовая рассылка; лимиты Telegram соблюдает планировщик отправки (sender.py)
+    with bulk_send():
+        for chunk in mention_chunks[1:]:
+            await bot.send_message(
+                chat_id=message.chat.id,
+                text=f"<i>{chunk}</i>",
+                parse_mode="HTML",
+                message_thread_id=message.message_thread_id
+            )
 
 
 async def notify_command(message: types.Message):
@@ -421,11 +389,11 @@ async def notify_command(message: types.Message):
     Обрабатывает команду /notify.
     Формат: /notify "Название команды" "Время" "Текст" [--important]
     """
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/notify'):
-        db.close()
+        await db.close()
         return
 
     # Получаем текст команды
@@ -442,7 +410,7 @@ async def notify_command(message: types.Message):
         # Проверяем, что у нас есть три аргумента: team_name, time, custom_message
         if len(parts) < 3:
             await message.reply('Использование: /notify "Название команды" "Время" "Текст" [--important]')
-            db.close()
+            await db.close()
             return
 
         # Извлекаем аргументы
@@ -456,33 +424,45 @@ async def notify_command(message: types.Message):
             # Убираем флаг из custom_message, если он там случайно оказался
             custom_message = custom_message.replace("--important", "").strip()
 
-        # Получаем участников команды из базы данных
-        members = get_team_members(db, team_name)
-        if not members:
+        # Получаем участников команды
+        team = await team_index.get_team(db, team_name)
+        if not team or not team.usernames:
             await message.reply(f"Команда '{team_name}' не найдена или не имеет участников.")
-            db.close()
+            await db.close()
+            return
+
+        # Время указывается в часовом поясе NOTIFY_TIMEZONE
+        due_at = parse_notify_time(time)
+        if due_at is None:
+            await message.reply('Неверный формат времени. Пример: /notify "Название команды" "25.12 18:00" "Текст"')
+            return
+        if due_at <= utc_now():
+            await message.reply("Указанное время уже прошло.")
             return
 
         # Получаем chat_id и message_thread_id (если есть)
         chat_id = message.chat.id
         message_thread_id = message.message_thread_id if message.is_topic_message else None
 
-        # Генерируем сообщение и дополнительные данные
-        notification_message, time_escaped, chat_id, message_thread_id = generate_notification_message(
-            team_name=team_name,
-            custom_message=custom_message,
-            time=time,
+        # Сохраняем уведомление в базе и планируем отправку
+        await notification_dispatcher.create(
+            db,
             chat_id=chat_id,
             message_thread_id=message_thread_id,
+            team_name=team_name,
+            text=custom_message,
+            is_important=is_important,
+            created_by=message.from_user.username,
+            due_at=due_at,
         )
 
         # Отправляем сообщение в чат
-        await message.reply("Отложенная задача создана")
+        await message.reply(f"Отложенная задача создана: {format_notify_time(due_at)}")
 
     except Exception as e:
         await message.reply(f"Ошибка при обработке команды: {e}")
     finally:
-        db.close()
+        await db.close()
 
 
 async def remove_member_command(message: Message):
@@ -493,11 +473,11 @@ async def remove_member_command(message: Message):
     :return: Ответ в чат с результатами удаления пользователей из команды.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/remove_member'):
-        db.close()
+        await db.close()
         return
 
     # Нормализация текста команды
@@ -508,37 +488,42 @@ async def remove_member_command(message: Message):
 
     if not team_name:
         await message.reply('Использование: /remove_member "<Название команды>" user1 user2 ...')
-        db.close()
+        await db.close()
         return
 
     usernames = remainder.split()
 
-    team = db.query(Team).filter(Team.team_name == team_name).first()
+    team = await db.scalar(
+        select(Team).options(selectinload(Team.members)).where(Team.team_name == team_name)
+    )
 
     if not team:
         await message.reply(f"Команда '{team_name}' не найдена.")
+        await db.close()
         return
 
     removed_users = []
     not_found_users = []
 
+    # Участники команды уже загружены вместе с ней
+    members_by_username = {member.username: member for member in team.members}
+
     for username in usernames:
         # Убираем символ @, если он есть
         username_without_at = username.lstrip('@')
 
         # Проверяем, есть ли пользователь в команде
-        user_in_team = (db.query(Member).join(Member.teams).filter(Team.id == team.id,Member.username == username_without_at).first())
-
-        print(user_in_team)
+        user_in_team = members_by_username.pop(username_without_at, None)
 
         if user_in_team:
-            # Устанавливаем NULL в поле team_id, удаляя пользователя из команды
-            user_in_team.team_id = None
+            # Удаляем связь пользователя с командой (сам пользователь остается)
+            team.members.remove(user_in_team)
             removed_users.append(f"@{username_without_at}")  # Приписываем @
         else:
             not_found_users.append(f"@{username_without_at}")  # Приписываем @
 
-    db.commit()
+    await db.commit()
+    team_index.invalidate()
 
     # Формируем сообщение для пользователя
     response_message = ""
@@ -552,7 +537,7 @@ async def remove_member_command(message: Message):
     if not removed_users and not not_found_users:
         response_message = f"Не удалось удалить пользователей из команды '{team_name}'."  # Пишем, если не было изменений
 
-    db.close()
+    await db.close()
 
     await message.answer(response_message)
 
@@ -568,60 +553,62 @@ async def ban_member_command(message: Message):
     :return: Ответ в чат с результатами бана пользователей.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
-    if not await check_user_and_permissions(db, message, '/ban_member'):
-        db.close()
+    member = await check_user_and_permissions(db, message, '/ban_member')
+    if not member:
+        await db.close()
         return
 
-    # Получаем информацию о пользователе
-    member = db.query(Member).filter(Member.username == message.from_user.username).first()
-
     args = message.text.split(maxsplit=1)
     if len(args) < 2:
         await message.reply("Использование: /ban_member <имя пользователя1> <имя пользователя2> ...")
-        db.close()
+        await db.close()
         return
 
     usernames = args[1].split()  # Разбиваем имена пользователей на список
 
     # Получаем роль "banned"
-    banned_role = db.query(Role).filter(Role.role_name == "banned").first()
+    banned_role = await db.scalar(select(Role).where(Role.role_name == "banned"))
 
     if not banned_role:
         await message.reply("Роль 'banned' не найдена. Пожалуйста, создайте эту роль.")
-        db.close()
+        await db.close()
         return
 
+    # Убираем символ @ и повторы, сохраняя порядок
+    usernames = list(dict.fromkeys(username.lstrip('@') for username in usernames))
+
+    # Загружаем всех пользователей и уровни их ролей одним запросом
+    targets = await get_targets_by_username(db, usernames)
+
+    to_ban = []
     banned_users = []
     not_found_users = []
     insufficient_level_users = []
 
     for username in usernames:
-        # Убираем символ @, если он есть
-        username_without_at = username.lstrip('@')
-
-        # Проверяем, существует ли пользователь в базе данных
-        user = db.query(Member).filter(Member.username == username_without_at).first()
+        user = targets.get(username)
 
         if user:
             # Проверяем, есть ли у пользователя роль
-            if not user.role:
-                insufficient_level_users.append(f"@{username_without_at} (роль отсутствует)")  # Роль отсутствует
+            if user.role_level is None:
+                insufficient_level_users.append(f"@{username} (роль отсутствует)")  # Роль отсутствует
                 continue
 
             # Сравниваем уровни
-            if member.role.level < user.role.level:
-                insufficient_level_users.append(f"@{username_without_at}")  # Этот пользователь не может быть забанен
+            if member.role_level < user.role_level:
+                insufficient_level_users.append(f"@{username}")  # Этот пользователь не может быть забанен
             else:
-                # Меняем роль пользователя на "banned"
-                user.role_id = banned_role.id  # Сменить роль на banned
-                banned_users.append(f"@{username_without_at}")  # Приписываем @
+                to_ban.append(user)
+                banned_users.append(f"@{username}")  # Приписываем @
         else:
-            not_found_users.append(f"@{username_without_at}")  # Приписываем @
+            not_found_users.append(f"@{username}")  # Приписываем @
 
-    db.commit()
+    # Меняем роль всех подходящих пользователей на "banned" одним запросом
+    await set_members_role(db, to_ban, banned_role.id)
+    await db.commit()
 
     # Формируем сообщение для пользователя
     response_message = ""
@@ -638,7 +625,7 @@ async def ban_member_command(message: Message):
     if not banned_users and not not_found_users and not insufficient_level_users:
         response_message = "Не удалось забанить пользователей."  # Пишем, если не было изменений
 
-    db.close()
+    await db.close()
 
     await message.answer(response_message)
 
@@ -654,57 +641,60 @@ async def assign_role_command(message: Message):
     :return: Ответ в чат с результатами назначения ролей пользователям.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
-    if not await check_user_and_permissions(db, message, '/assign_role'):
-        db.close()
+    member = await check_user_and_permissions(db, message, '/assign_role')
+    if not member:
+        await db.close()
         return
 
-    # Получаем информацию о пользователе
-    member = db.query(Member).filter(Member.username == message.from_user.username).first()
-
     # Разбиваем команду на аргументы
     args = message.text.split(maxsplit=2)
     if len(args) < 3:
         await message.reply("Использование: /assign_role <роль> <имя пользователя1> <имя пользователя2> ...")
-        db.close()
+        await db.close()
         return
 
     role_name = args[1]  # Название роли
     usernames = args[2].split()  # Имена пользователей
 
     # Получаем роль, которую нужно назначить
-    target_role = db.query(Role).filter(Role.role_name == role_name).first()
+    target_role = await db.scalar(select(Role).where(Role.role_name == role_name))
 
     if not target_role:
         await message.reply(f"Роль '{role_name}' не найдена.")
-        db.close()
+        await db.close()
         return
 
+    # Убираем символ @ и повторы, сохраняя порядок
+    usernames = list(dict.fromkeys(username.lstrip('@') for username in usernames))
+
+    # Загружаем всех пользователей и уровни их ролей одним запросом
+    targets = await get_targets_by_username(db, usernames)
+
     # Список для отслеживания успешных и неудачных попыток назначения
+    to_assign = []
     successfully_assigned = []
     insufficient_level = []
     not_found_users = []
 
     for username in usernames:
-        username_without_at = username.lstrip('@')
-
-        # Проверяем, существует ли пользователь в базе данных
-        target_user = db.query(Member).filter(Member.username == username_without_at).first()
+        target_user = targets.get(username)
 
         if target_user:
             # Проверяем, может ли текущий пользователь назначить роль
-            if member.role.level >= target_role.level:
-                # Назначаем роль пользователю
-                target_user.role_id = target_role.id
-                successfully_assigned.append(f"@{username_without_at}")
+            if member.role_level >= target_role.level:
+                to_assign.append(target_user)
+                successfully_assigned.append(f"@{username}")
             else:
-                insufficient_level.append(f"@{username_without_at} (уровень роли слишком высок для назначения)")
+                insufficient_level.append(f"@{username} (уровень роли слишком высок для назначения)")
         else:
-            not_found_users.append(f"@{username_without_at}")  # Приписываем @
+            not_found_users.append(f"@{username}")  # Приписываем @
 
-    db.commit()
+    # Назначаем роль всем подходящим пользователям одним запросом
+    await set_members_role(db, to_assign, target_role.id)
+    await db.commit()
 
     # Формируем сообщение для пользователя
     response_message = ""
@@ -721,7 +711,7 @@ async def assign_role_command(message: Message):
     if not successfully_assigned and not insufficient_level and not not_found_users:
         response_message = "Не удалось назначить роли."  # Пишем, если не было изменений
 
-    db.close()
+    await db.close()
 
     await message.answer(response_message)
 
@@ -737,24 +727,19 @@ async def help_command(message: Message):
     :return: Ответ в чат с доступными командами и их описанием.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
-    if not await check_user_and_permissions(db, message, '/help'):
-        db.close()
+    member = await check_user_and_permissions(db, message, '/help')
+    if not member:
+        await db.close()
         return
 
-    # Получаем данные о пользователе
-    member = db.query(Member).filter(Member.telegram_id == message.from_user.id).first()
-
-    # Получаем роль пользователя
-    role = member.role
-
     # Получаем список команд, которые доступны для роли пользователя и не являются администраторами
-    role_commands = db.query(Command).join(RoleCommands).filter(
-        RoleCommands.role_id == role.id,
+    role_commands = (await db.scalars(select(Command).join(RoleCommands).where(
+        RoleCommands.role_id == member.role_id,
         Command.is_admin_command == False  # Фильтрация по полю is_admin_command
-    ).all()
+    ))).all()
 
     # Формируем описание команд
     commands_list = ""
@@ -796,7 +781,7 @@ async def help_command(message: Message):
     {commands_list}
     """
 
-    db.close()
+    await db.close()
 
     await message.answer(help_message, parse_mode="HTML")
 
@@ -812,19 +797,19 @@ async def help_admin_command(message: Message):
     :return: Ответ в чат с описанием доступных административных команд и ролей.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/help_admin'):
-        db.close()
+        await db.close()
         return
 
     # Получаем список всех команд, которые являются административными
-    admin_commands = db.query(Command).filter(Command.is_admin_command == True).all()
+    admin_commands = (await db.scalars(select(Command).where(Command.is_admin_command == True))).all()
 
     if not admin_commands:
         await message.reply("Нет доступных административных команд.")
-        db.close()
+        await db.close()
         return
 
     # Формируем описание команд
@@ -859,7 +844,7 @@ async def help_admin_command(message: Message):
         commands_list += command_message + "\n"
 
     # Получаем список всех ролей из базы данных
-    roles = db.query(Role).all()
+    roles = (await db.scalars(select(Role))).all()
     roles_list = "\n".join([f"• {role.role_name} (уровень {role.level})" for role in roles])
 
     help_message = f"""
@@ -870,7 +855,7 @@ async def help_admin_command(message: Message):
 {roles_list}
 """
 
-    db.close()
+    await db.close()
 
     await message.answer(help_message, parse_mode="HTML")
 
@@ -880,45 +865,61 @@ async def help_admin_command(message: Message):
 
 async def teams_command(message: Message):
     """
-    Обрабатывает команду /teams, выводя список всех команд и их участников.
+    Обрабатывает команду /teams, выводя первую страницу списка команд и их участников.
+    Остальные страницы открываются кнопками (см. teams_page_callback).
 
     :param message: Сообщение от пользователя, содержащее команду.
     :return: Ответ в чат с перечнем команд и участников.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/teams'):
-        db.close()
+        await db.close()
         return
 
-    # Получаем все команды
-    teams = db.query(Team).all()
+    # Получаем все команды с участниками
+    teams = await team_index.items(db)
+    await db.close()
 
-    # Формируем сообщение о командах
-    teams_list = ""
-    for team in teams:
-        # Получаем участников команды
-        members = db.query(Member).join(Member.teams).filter(Team.id == team.id).all()
-        member_names = [member.username for member in members]
+    # Формируем первую страницу списка
+    text, page, pages = format_teams_page(teams, 0)
 
-        # Формируем строку с участниками команды
-        team_members = ", ".join(member_names) if member_names else "Нет участников"
+    # Отправляем ответ пользователю
+    await message.answer(text, parse_mode="HTML", reply_markup=teams_keyboard(page, pages))
 
-        teams_list += f"<b>Команда:</b> {team.team_name}\n"
-        teams_list += f"<b>Участники:</b> {team_members}\n\n"
+    # Удаляем сообщение пользователя после успешной обработки
+    await delete_user_message(message)
 
-    if not teams_list:
-        teams_list = "Нет доступных команд."
 
-    db.close()
+async def teams_page_callback(callback: CallbackQuery):
+    """
+    Обрабатывает кнопки листания списка команд (/teams): заменяет текст сообщения нужной страницей.
 
-    # Отправляем ответ пользователю
-    await message.answer(f"<b>Список команд и их участников:</b>\n\n{teams_list}", parse_mode="HTML")
+    :param callback: Нажатие кнопки с callback_data вида "teams:<номер страницы>"
+    :return: Нет возвращаемого значения (None).
+    """
 
-    # Удаляем сообщение пользователя после успешной обработки
-    await delete_user_message(message)
+    try:
+        requested_page = int(callback.data.removeprefix(TEAMS_PAGE_PREFIX))
+    except ValueError:
+        await callback.answer()
+        return
+
+    db = get_session()
+    teams = await team_index.items(db)
+    await db.close()
+
+    text, page, pages = format_teams_page(teams, requested_page)
+
+    try:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=teams_keyboard(page, pages))
+    except TelegramBadRequest:
+        # Страница не изменилась (например, кнопку нажали дважды) или сообщение уже удалено
+        pass
+
+    await callback.answer()
 
 
 async def edit_handler_command(message: Message):
@@ -929,26 +930,18 @@ async def edit_handler_command(message: Message):
     :return: Ответ в чат с уведомлением об успешном редактировании команды.
     """
 
-    db = SessionLocal()
-
-    # Получаем данные о пользователе
-    user = db.query(Member).filter(Member.telegram_id == message.from_user.id).first()
-
-    if not user:
-        await message.reply("Пользователь не найден в базе данных.")
-        db.close()
-        return
+    db = get_session()
 
     # Проверяем, есть ли у пользователя права на редактирование
     if not await check_user_and_permissions(db, message, '/edit_handler'):
-        db.close()
+        await db.close()
         return
 
     args = message.text.split(maxsplit=3)
 
     if len(args) < 4:
         await message.reply("Использование: /edit_handler <command_name> <column_name> <new_value>")
-        db.close()
+        await db.close()
         return
 
     command_name = args[1]
@@ -956,11 +949,11 @@ async def edit_handler_command(message: Message):
     new_value = args[3]
 
     # Находим команду по имени
-    command = db.query(Command).filter(Command.command_name == command_name).first()
+    command = await db.scalar(select(Command).where(Command.command_name == command_name))
 
     if not command:
         await message.reply(f"Команда '{command_name}' не найдена.")
-        db.close()
+        await db.close()
         return
 
     # Проверка, существует ли такой столбец
@@ -968,15 +961,18 @@ async def edit_handler_command(message: Message):
 
     if column_name not in valid_columns:
         await message.reply(f"Недопустимый столбец. Доступные столбцы: {', '.join(valid_columns)}.")
-        db.close()
+        await db.close()
         return
 
     # Редактируем значение в указанном столбце
     setattr(command, column_name, new_value)
 
-    db.commit()
+    await db.commit()
+
+    # Данные команд изменились, матрицу прав нужно перестроить
+    permission_matrix.invalidate()
 
-    db.close()
+    await db.close()
 
     await message.answer(f"Команда '{command_name}' успешно обновлена.\n"
                          f"Обновленный {column_name}: {new_value}")
@@ -993,18 +989,18 @@ async def role_manage_command(message: Message):
     :return: Ответ в чат с результатами операции с ролью.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/role_manage'):
-        db.close()
+        await db.close()
         return
 
     args = message.text.split(maxsplit=4)
 
     if len(args) < 3:
         await message.reply("Использование: /role_manage <create|edit|delete|edit_level> <role_name> <new_value>")
-        db.close()
+        await db.close()
         return
 
     operation = args[1].lower()
@@ -1014,24 +1010,25 @@ async def role_manage_command(message: Message):
     if operation == "create":
         if len(args) < 4:
             await message.reply("Для создания роли укажите название роли и уровень (например, 'create <role_name> <level>').")
-            db.close()
+            await db.close()
             return
 
         level = int(args[3]) if args[3].isdigit() else 0  # Уровень роли, если не указан, по умолчанию 0
 
         # Проверяем, существует ли роль с таким названием
-        existing_role = db.query(Role).filter(Role.role_name == role_name).first()
+        existing_role = await db.scalar(select(Role).where(Role.role_name == role_name))
         if existing_role:
             await message.reply(f"Роль '{role_name}' уже существует.")
-            db.close()
+            await db.close()
             return
 
         # Создаем роль
         new_role = Role(role_name=role_name, level=level)
         db.add(new_role)
-        db.commit()
+        await db.commit()
+        permission_matrix.invalidate()
 
-        db.close()
+        await db.close()
         await message.answer(f"Роль '{role_name}' успешно создана с уровнем {level}.")
 
         # Удаляем сообщение пользователя после успешной обработки
@@ -1041,30 +1038,30 @@ async def role_manage_command(message: Message):
     elif operation == "edit_name":
         if len(args) < 4:
             await message.reply("Для редактирования роли укажите новое имя роли (например, 'edit_name <old_role_name> <new_role_name>').")
-            db.close()
+            await db.close()
             return
 
         new_role_name = args[3]
 
         # Ищем роль по имени
-        role = db.query(Role).filter(Role.role_name == role_name).first()
+        role = await db.scalar(select(Role).where(Role.role_name == role_name))
         if not role:
             await message.reply(f"Роль '{role_name}' не найдена.")
-            db.close()
+            await db.close()
             return
 
         # Проверка, не существует ли уже роль с таким именем
-        existing_role = db.query(Role).filter(Role.role_name == new_role_name).first()
+        existing_role = await db.scalar(select(Role).where(Role.role_name == new_role_name))
         if existing_role:
             await message.reply(f"Роль с именем '{new_role_name}' уже существует.")
 
-            db.close()
+            await db.close()
             return
 
         # Обновляем имя роли
         role.role_name = new_role_name
-        db.commit()
-        db.close()
+        await db.commit()
+        await db.close()
 
         await message.answer(f"Имя роли '{role_name}' успешно изменено на '{new_role_name}'.")
 
@@ -1075,17 +1072,19 @@ async def role_manage_command(message: Message):
     # Удаление роли
     elif operation == "delete":
         # Ищем роль по имени
-        role = db.query(Role).filter(Role.role_name == role_name).first()
+        role = await db.scalar(select(Role).where(Role.role_name == role_name))
         if not role:
             await message.reply(f"Роль '{role_name}' не найдена.")
-            db.close()
+            await db.close()
             return
 
         # Удаляем роль
-        db.delete(role)
-        db.commit()
+        await db.delete(role)
+        await db.commit()
+        permission_matrix.invalidate()
+        member_cache.clear()
 
-        db.close()
+        await db.close()
         await message.answer(f"Роль '{role_name}' была удалена.")
 
         # Удаляем сообщение пользователя после успешной обработки
@@ -1095,23 +1094,26 @@ async def role_manage_command(message: Message):
     elif operation == "edit_level":
         if len(args) < 4:
             await message.reply("Для изменения уровня роли укажите новый уровень (например, 'edit_level <role_name> <new_level>').")
-            db.close()
+            await db.close()
             return
 
         new_level = int(args[3]) if args[3].isdigit() else 0
 
         # Ищем роль по имени
-        role = db.query(Role).filter(Role.role_name == role_name).first()
+        role = await db.scalar(select(Role).where(Role.role_name == role_name))
         if not role:
             await message.reply(f"Роль '{role_name}' не найдена.")
-            db.close()
+            await db.close()
             return
 
         # Обновляем уровень
         role.level = new_level
-        db.commit()
+        await db.commit()
+
+        # Уровень роли хранится в снимках пользователей
+        member_cache.clear()
 
-        db.close()
+        await db.close()
         await message.answer(f"Уровень роли '{role_name}' обновлен. Новый уровень: {new_level}.")
 
         # Удаляем сообщение пользователя после успешной обработки
@@ -1119,7 +1121,7 @@ async def role_manage_command(message: Message):
 
     else:
         await message.reply("Недопустимая операция. Доступные операции: create, edit, delete, edit_level.")
-        db.close()
+        await db.close()
 
 
 async def list_roles_command(message: Message):
@@ -1130,22 +1132,22 @@ async def list_roles_command(message: Message):
     :return: Ответ в чат с перечнем ролей и связанных с ними команд.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя и разрешение на команду
     if not await check_user_and_permissions(db, message, '/list_roles'):
-        db.close()
+        await db.close()
         return
 
     # Извлекаем все роли из базы данных
-    roles = db.query(Role).all()
+    roles = (await db.scalars(select(Role))).all()
 
     # Формируем сообщение со списком ролей
     if roles:
         roles_list = "<b>Список всех ролей и доступных команд:</b>\n\n"
         for role in roles:
             # Получаем команды, доступные для данной роли
-            commands = db.query(Command).join(RoleCommands).filter(RoleCommands.role_id == role.id).all()
+            commands = (await db.scalars(select(Command).join(RoleCommands).where(RoleCommands.role_id == role.id))).all()
 
             # Формируем строку с командами для роли
             commands_list = ", ".join([command.command_name for command in commands]) if commands else "Нет доступных команд"
@@ -1156,7 +1158,7 @@ async def list_roles_command(message: Message):
     else:
         roles_list = "Нет доступных ролей."
 
-    db.close()
+    await db.close()
 
     # Отправляем сообщение пользователю
     await message.answer(roles_list, parse_mode="HTML")
@@ -1173,18 +1175,18 @@ async def role_commands_manage_command(message: Message):
     :return: Ответ в чат с результатами добавления или удаления команд для роли.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/role_commands_manage'):
-        db.close()
+        await db.close()
         return
 
     args = message.text.split(maxsplit=3)
 
     if len(args) < 3:
         await message.reply("Использование: /role_commands_manage <add_commands|remove_commands> <role_name> </command1> </command2> ...")
-        db.close()
+        await db.close()
         return
 
     operation = args[1].lower()
@@ -1192,10 +1194,10 @@ async def role_commands_manage_command(message: Message):
     command_names = args[3].split()  # Разбиваем команды по пробелам
 
     # Проверяем, существует ли роль
-    role = db.query(Role).filter(Role.role_name == role_name).first()
+    role = await db.scalar(select(Role).where(Role.role_name == role_name))
     if not role:
         await message.reply(f"Роль '{role_name}' не найдена.")
-        db.close()
+        await db.close()
         return
 
     successful_operations = []
@@ -1204,13 +1206,13 @@ async def role_commands_manage_command(message: Message):
     if operation == "add_commands":
         # Обрабатываем добавление команд
         for command_name in command_names:
-            command = db.query(Command).filter(Command.command_name == command_name).first()
+            command = await db.scalar(select(Command).where(Command.command_name == command_name))
             if not command:
                 failed_operations.append(f"Команда '{command_name}' не найдена.")
                 continue
 
             # Проверяем, не добавлена ли уже команда
-            existing_role_command = db.query(RoleCommands).filter(RoleCommands.role_id == role.id, RoleCommands.command_id == command.id).first()
+            existing_role_command = await db.scalar(select(RoleCommands).where(RoleCommands.role_id == role.id, RoleCommands.command_id == command.id))
             if existing_role_command:
                 failed_operations.append(f"Команда '{command_name}' уже доступна для роли '{role_name}'.")
                 continue
@@ -1223,28 +1225,29 @@ async def role_commands_manage_command(message: Message):
     elif operation == "remove_commands":
         # Обрабатываем удаление команд
         for command_name in command_names:
-            command = db.query(Command).filter(Command.command_name == command_name).first()
+            command = await db.scalar(select(Command).where(Command.command_name == command_name))
             if not command:
                 failed_operations.append(f"Команда '{command_name}' не найдена.")
                 continue
 
             # Проверяем, привязана ли команда к роли
-            role_command = db.query(RoleCommands).filter(RoleCommands.role_id == role.id, RoleCommands.command_id == command.id).first()
+            role_command = await db.scalar(select(RoleCommands).where(RoleCommands.role_id == role.id, RoleCommands.command_id == command.id))
             if not role_command:
                 failed_operations.append(f"Команда '{command_name}' не привязана к роли '{role_name}'.")
                 continue
 
             # Удаляем команду из роли
-            db.delete(role_command)
+            await db.delete(role_command)
             successful_operations.append(f"Команда '{command_name}' была удалена из роли '{role_name}'.")
 
     else:
         await message.reply("Недопустимая операция. Доступные операции: add_commands, remove_commands.")
-        db.close()
+        await db.close()
         return
 
-    db.commit()
-    db.close()
+    await db.commit()
+    permission_matrix.invalidate()
+    await db.close()
 
     # Формируем ответное сообщение
     response_message = ""
@@ -1269,19 +1272,19 @@ async def list_topics_command(message: Message):
     :return: Ответ в чат с перечнем топиков и команд, связанных с ними.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверка на разрешения
     if not await check_user_and_permissions(db, message, '/list_topics'):
-        db.close()
+        await db.close()
         return
 
     # Получаем все топики
-    topics = db.query(Topic).all()
+    topics = (await db.scalars(select(Topic))).all()
 
     if not topics:
         await message.reply("Нет доступных топиков.")
-        db.close()
+        await db.close()
         return
 
     # Формируем сообщение с топиками и их командами
@@ -1290,7 +1293,7 @@ async def list_topics_command(message: Message):
         description = topic.description if topic.description else "Без описания"
 
         # Получаем список команд для каждого топика
-        commands_in_topic = db.query(Command).join(TopicCommands).filter(TopicCommands.topic_id == topic.id).all()
+        commands_in_topic = (await db.scalars(select(Command).join(TopicCommands).where(TopicCommands.topic_id == topic.id))).all()
 
         # Формируем строку с командами
         if commands_in_topic:
@@ -1300,7 +1303,7 @@ async def list_topics_command(message: Message):
 
         topics_message += f"🔹 <b>{topic.topic_name}</b>\n{description}\nКоманды:\n{commands_list}\n\n"
 
-    db.close()
+    await db.close()
     await message.answer(topics_message, parse_mode="HTML")
 
     # Удаляем сообщение пользователя после успешной обработки
@@ -1315,11 +1318,11 @@ async def topics_manage_command(message: Message):
     :return: Ответ в чат, уведомляющий пользователя о результатах операции с топиком.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/topics_manage'):
-        db.close()
+        await db.close()
         return
 
     # Парсинг аргументов
@@ -1328,22 +1331,23 @@ async def topics_manage_command(message: Message):
     if operation == "add":
         if not remainder:
             await message.reply("Для добавления топика укажите описание (пример: /topics_manage add \"Топик\" Описание).")
-            db.close()
+            await db.close()
             return
 
         description = remainder
 
         # Проверяем, существует ли уже такой топик
-        existing_topic = db.query(Topic).filter(Topic.topic_name == topic_name).first()
+        existing_topic = await db.scalar(select(Topic).where(Topic.topic_name == topic_name))
         if existing_topic:
             await message.reply(f"Топик '{topic_name}' уже существует.")
-            db.close()
+            await db.close()
             return
 
         new_topic = Topic(topic_name=topic_name, description=description)
         db.add(new_topic)
-        db.commit()
-        db.close()
+        await db.commit()
+        topic_index.invalidate()
+        await db.close()
 
         await message.answer(f"Топик '{topic_name}' успешно добавлен с описанием: {description}.")
 
@@ -1353,20 +1357,20 @@ async def topics_manage_command(message: Message):
     elif operation == "edit":
         if not remainder:
             await message.reply("Для редактирования топика укажите новое описание (пример: /topics_manage edit \"Топик\" НовоеОписание).")
-            db.close()
+            await db.close()
             return
 
         new_description = remainder
 
-        topic = db.query(Topic).filter(Topic.topic_name == topic_name).first()
+        topic = await db.scalar(select(Topic).where(Topic.topic_name == topic_name))
         if not topic:
             await message.reply(f"Топик '{topic_name}' не найден.")
-            db.close()
+            await db.close()
             return
 
         topic.description = new_description
-        db.commit()
-        db.close()
+        await db.commit()
+        await db.close()
 
         await message.answer(f"Описание топика '{topic_name}' успешно обновлено.")
 
@@ -1375,15 +1379,16 @@ async def topics_manage_command(message: Message):
 
     elif operation == "delete":
         # Ищем топик по имени
-        topic = db.query(Topic).filter(Topic.topic_name == topic_name).first()
+        topic = await db.scalar(select(Topic).where(Topic.topic_name == topic_name))
         if not topic:
             await message.reply(f"Топик '{topic_name}' не найден.")
-            db.close()
+            await db.close()
             return
 
-        db.delete(topic)
-        db.commit()
-        db.close()
+        await db.delete(topic)
+        await db.commit()
+        topic_index.invalidate()
+        await db.close()
 
         await message.answer(f"Топик '{topic_name}' был удален.")
 
@@ -1392,7 +1397,7 @@ async def topics_manage_command(message: Message):
 
     else:
         await message.reply("Недопустимая операция. Доступные операции: add, edit, delete.")
-        db.close()
+        await db.close()
 
 
 async def topics_commands_manage_command(message: Message):
@@ -1403,10 +1408,10 @@ async def topics_commands_manage_command(message: Message):
     :return: Ответ в чат, уведомляющий пользователя о результатах операции с командами топика.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     if not await check_user_and_permissions(db, message, '/topics_commands_manage'):
-        db.close()
+        await db.close()
         return
 
     # Парсинг аргументов
@@ -1414,60 +1419,63 @@ async def topics_commands_manage_command(message: Message):
 
     if not remainder:
         await message.reply('Укажите хотя бы одну команду: /topics_commands_manage <add|remove> "<topic_name>" /command1 /command2 ...')
-        db.close()
+        await db.close()
         return
 
     # Список команд
     commands_to_manage = remainder.split()
 
-    topic = db.query(Topic).filter(Topic.topic_name == topic_name).first()
+    topic = await db.scalar(select(Topic).where(Topic.topic_name == topic_name))
     if not topic:
         await message.reply(f"Топик '{topic_name}' не найден.")
-        db.close()
+        await db.close()
         return
 
     result_message = f"Результат выполнения операции '{operation}' для топика '{topic_name}':\n\n"
 
     if operation == 'add':
         for command_name in commands_to_manage:
-            command = db.query(Command).filter(Command.command_name == command_name).first()
+            command = await db.scalar(select(Command).where(Command.command_name == command_name))
             if not command:
                 result_message += f"❌ Команда '{command_name}' не найдена.\n"
                 continue
 
-            existing_topic_command = db.query(TopicCommands).filter(
+            existing_topic_command = await db.scalar(select(TopicCommands).where(
                 TopicCommands.topic_id == topic.id,
                 TopicCommands.command_id == command.id
-            ).first()
+            ))
             if existing_topic_command:
                 result_message += f"🔹 Команда '{command_name}' уже добавлена в топик '{topic_name}'.\n"
             else:
                 topic_command = TopicCommands(topic_id=topic.id, command_id=command.id)
                 db.add(topic_command)
-                db.commit()
+                await db.commit()
                 result_message += f"✅ Команда '{command_name}' успешно добавлена в топик '{topic_name}'.\n"
 
     elif operation == 'remove':
         for command_name in commands_to_manage:
-            command = db.query(Command).filter(Command.command_name == command_name).first()
+            command = await db.scalar(select(Command).where(Command.command_name == command_name))
             if not command:
                 result_message += f"❌ Команда '{command_name}' не найдена.\n"
                 continue
 
-            topic_command = db.query(TopicCommands).filter(
+            topic_command = await db.scalar(select(TopicCommands).where(
                 TopicCommands.topic_id == topic.id,
                 TopicCommands.command_id == command.id
-            ).first()
+            ))
             if topic_command:
-                db.delete(topic_command)
-                db.commit()
+                await db.delete(topic_command)
+                await db.commit()
                 result_message += f"✅ Команда '{command_name}' успешно удалена из топика '{topic_name}'.\n"
             else:
                 result_message += f"🔹 Команда '{command_name}' не найдена в топике '{topic_name}'.\n"
     else:
         result_message = "Недопустимая операция. Доступные операции: add, remove."
 
-    db.close()
+    # Разрешенные команды топика могли измениться
+    topic_index.invalidate()
+
+    await db.close()
     await message.answer(result_message)
 
     # Удаляем сообщение пользователя после успешной обработки
@@ -1483,7 +1491,7 @@ async def random_number_command(message: types.Message):
     :return: Ответ в чат с результатом генерации случайного числа и случайным эмодзи.
     """
 
-    db = SessionLocal()
+    db = get_session()
 
     # Генерация случайного сид на основе времени и ID сообщения
     message_id = message.message_id
@@ -1494,7 +1502,7 @@ async def random_number_command(message: types.Message):
 
     # Проверяем пользователя, чат и разрешение команды
     if not await check_user_and_permissions(db, message, '/random_number'):
-        db.close()
+        await db.close()
         return
 
     # Разбираем сообщение, чтобы извлечь число
@@ -1503,8 +1511,11 @@ async def random_number_command(message: types.Message):
     # Если число не указано или указано некорректно
     if len(args) < 2 or not args[1].isdigit():
         await message.reply("Пожалуйста, введите команду в формате: /random_number <число>")
+        await db.close()
         return
 
+    await db.close()
+
     # Извлекаем число, до которого будет генерироваться случайное
     upper_limit = int(args[1])
 
@@ -1529,15 +1540,17 @@ async def random_choice_command(message: types.Message):
     :param message: Сообщение от пользователя, содержащее команду и список значений.
     :return: Ответ в чат с результатом случайного выбора.
     """
-    db = SessionLocal()
+    db = get_session()
 
     # Проверка разрешений пользователя
     if not await check_user_and_permissions(db, message, '/random_choice'):
-        db.close()
+        await db.close()
         return
 
     # Разбираем сообщение, чтобы извлечь список значений
     # Убираем команду и разделяем оставшуюся часть по символу '/'
+    await db.close()
+
     command_parts = message.text.split(maxsplit=1)
     if len(command_parts) < 2:
         await message.reply("Пожалуйста, введите команду в формате: /random_choice <значение1> / <значение2> / ...")
@@ -1565,36 +1578,24 @@ async def top_commands_command(message: types.Message):
     :param message: Сообщение от пользователя, содержащее команду и список значений.
     :return: Ответ в чат в виде графика со статистикой.
     """
-    db = SessionLocal()
+    db = get_session()
 
     if not await check_user_and_permissions(db, message, '/top_commands'):
-        db.close()
+        await db.close()
         return
 
     period = message.text.split()[1] if len(message.text.split()) > 1 else "30d"
     days = int(period[:-1])
-    start_date = datetime.now() - timedelta(days=days)
-
-    commands_history = db.query(CommandHistory.command) \
-                         .filter(CommandHistory.timestamp >= start_date) \
-                         .all()
-
-    command_counts = {}
-    for record in commands_history:
-        command_name = extract_command_name(record.command)
-        if command_name:  # Игнорируем пустые команды
-            command_counts[command_name] = command_counts.get(command_name, 0) + 1
+    start_date = utc_now() - timedelta(days=days)
 
-    # Удаляем пустые команды из статистики
-    filtered_commands = {k: v for k, v in command_counts.items() if k}
+    # Подсчет и сортировка выполняются в базе данных
+    sorted_commands = await get_top_commands(db, start_date)
 
-    if not filtered_commands:
+    if not sorted_commands:
         await message.reply("❌ За указанный период нет данных о командах.")
-        db.close()
+        await db.close()
         return
 
-    sorted_commands = sorted(filtered_commands.items(), key=lambda x: x[1], reverse=True)[:5]
-
     commands, counts = zip(*sorted_commands)
 
     await send_chart(
@@ -1604,10 +1605,11 @@ async def top_commands_command(message: types.Message):
         y_values=counts,
         x_label="Команды",
         y_label="Количество вызовов",
-        caption=f"📊 Топ самых популярных команд за последние {days} дней"
+        caption=f"📊 Топ самых популярных команд за последние {days} дней",
+        kind="top_commands"
     )
 
-    db.close()
+    await db.close()
 
     # Удаляем сообщение пользователя после успешной обработки
     await delete_user_message(message)
@@ -1620,37 +1622,29 @@ async def top_users_handler_command(message: types.Message):
     :param message: Сообщение от пользователя, содержащее команду и список значений.
     :return: Ответ в чат в виде графика со статистикой.
     """
-    db = SessionLocal()
+    db = get_session()
 
     if not await check_user_and_permissions(db, message, '/top_users_handler'):
-        db.close()
+        await db.close()
         return
 
     args = message.text.split()
     if len(args) < 2:
         await message.reply("Пожалуйста, укажите команду и период (например, /top_users_handler /help 10d).")
-        db.close()
+        await db.close()
         return
 
     command = args[1]
     period = args[2] if len(args) > 2 else "30d"
     days = int(period[:-1])
-    start_date = datetime.now() - timedelta(days=days)
-
-    commands_history = db.query(CommandHistory.username, CommandHistory.command) \
-                         .filter(CommandHistory.timestamp >= start_date) \
-                         .all()
+    start_date = utc_now() - timedelta(days=days)
 
-    user_counts = {}
-    for username, full_command in commands_history:
-        if extract_command_name(full_command) == command:
-            user_counts[username] = user_counts.get(username, 0) + 1
-
-    sorted_users = sorted(user_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+    # Подсчет и сортировка выполняются в базе данных
+    sorted_users = await get_top_users_for_command(db, command, start_date)
 
     if not sorted_users:
         await message.reply(f"❌ За указанный период нет данных по команде {command}.")
-        db.close()
+        await db.close()
         return
 
     usernames, counts = zip(*sorted_users)
@@ -1662,10 +1656,11 @@ async def top_users_handler_command(message: types.Message):
         y_values=counts,
         x_label="Пользователи",
         y_label="Количество вызовов",
-        caption=f"📊 Топ пользователей, использовавших {command} за последние {days} дней"
+        caption=f"📊 Топ пользователей, использовавших {command} за последние {days} дней",
+        kind="top_users_handler"
     )
 
-    db.close()
+    await db.close()
 
     # Удаляем сообщение пользователя после успешной обработки
     await delete_user_message(message)
@@ -1678,29 +1673,22 @@ async def top_users_command(message: types.Message):
     :param message: Сообщение от пользователя, содержащее команду и список значений.
     :return: Ответ в чат в виде графика со статистикой.
     """
-    db = SessionLocal()
+    db = get_session()
 
     if not await check_user_and_permissions(db, message, '/top_users'):
-        db.close()
+        await db.close()
         return
 
     period = message.text.split()[1] if len(message.text.split()) > 1 else "30d"
     days = int(period[:-1])
-    start_date = datetime.now() - timedelta(days=days)
-
-    commands_history = db.query(CommandHistory.username) \
-                         .filter(CommandHistory.timestamp >= start_date) \
-                         .all()
-
-    user_counts = {}
-    for (username,) in commands_history:
-        user_counts[username] = user_counts.get(username, 0) + 1
+    start_date = utc_now() - timedelta(days=days)
 
-    sorted_users = sorted(user_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+    # Подсчет и сортировка выполняются в базе данных
+    sorted_users = await get_top_users(db, start_date)
 
     if not sorted_users:
         await message.reply("❌ За указанный период нет данных о пользователях.")
-        db.close()
+        await db.close()
         return
 
     usernames, counts = zip(*sorted_users)
@@ -1712,10 +1700,11 @@ async def top_users_command(message: types.Message):
         y_values=counts,
         x_label="Пользователи",
         y_label="Количество обращений",
-        caption=f"📊 Топ пользователей за последние {days} дней"
+        caption=f"📊 Топ пользователей за последние {days} дней",
+        kind="top_users"
     )
 
-    db.close()
+    await db.close()
 
     # Удаляем сообщение пользователя после успешной обработки
     await delete_user_message(message)
@@ -1758,59 +1747,46 @@ async def pre_checkout_handler(pre_checkout_query: PreCheckoutQuery):
 
 
 async def success_payment_handler(message: Message):  
-    db = SessionLocal()
+    db = get_session()
 
     # Получаем пользователя из базы данных
-    member = db.query(Member).filter(Member.username == message.from_user.username).first()
+    member = await db.scalar(select(Member).where(Member.username == message.from_user.username))
     if not member:
         await message.answer("Пользователь не найден в базе данных.")
-        db.close()
+        await db.close()
         return
 
     # Получаем количество звезд из успешного платежа
     stars_amount = message.successful_payment.total_amount
 
-    # Увеличиваем баланс пользователя (100 кредитов за 1 звезду)
-    member.balance += stars_amount * 200
-    db.commit()
+    # Увеличиваем баланс пользователя (200 кредитов за 1 звезду) атомарным UPDATE
+    amount = stars_amount * 200
+    balance = await credit_balance(db, member.id, amount)
 
     # Отправляем сообщение с благодарностью и новым балансом
-    await message.answer(f"🥳 Ваш баланс пополнен на {stars_amount * 200} кредитов.\n"
-                         f"Текущий баланс: {member.balance} кредитов.")
+    await message.answer(f"🥳 Ваш баланс пополнен на {amount} кредитов.\n"
+                         f"Текущий баланс: {balance} кредитов.")
 
-    db.close()
+    await db.close()
 
 
-# Глобальный словарь для отслеживания состояния пользователей
-active_casino_users = {}
-
 async def casino_command(message: Message):
     """
     Обрабатывает команду /casino и броски слота-эмодзи (🎰).
+    Ставка списывается и выигрыш начисляется атомарными UPDATE в базе,
+    поэтому одновременные прокрутки одного пользователя не могут потратить больше его баланса.
     """
-    db = SessionLocal()
+    db = get_session()
     try:
-        if not await check_user_and_permissions(db, message, '/casino'):
-            return
-
-        member = db.query(Member).filter(Member.username == message.from_user.username).first()
-        if not member:
-            await message.reply("Пользователь не найден в базе данных.")
-            return
-
-        if active_casino_users.get(message.from_user.id, False):
-            await message.reply("Подождите, пока завершится текущая прокрутка.")
+        snapshot = await check_user_and_permissions(db, message, '/casino')
+        if not snapshot:
             return
 
-        active_casino_users[message.from_user.id] = True
-
         # Определяем ставку
-        if getattr(message, "dice", None) and message.dice.emoji == "🎰":
-            bet = 50
-            dice_value = message.dice.value
-        else:
+        is_dice = getattr(message, "dice", None) and message.dice.emoji == "🎰"
+        bet = 50
+        if not is_dice:
             command_parts = (message.text or "").split()
-            bet = 50
             if len(command_parts) > 1:
                 try:
                     bet = int(command_parts[1])
@@ -1821,67 +1797,59 @@ async def casino_command(message: Message):
                     await message.reply("Ставка должна быть числом.")
                     return
 
-            if member.balance < bet:
-                await message.reply(
-                    f"💸Недостаточно средств для игры. Ваш баланс: {member.balance} очков.\n\n⭐️Пополнить баланс можете через /donate"
-                )
+        # Списываем ставку, только если на балансе достаточно средств
+        balance = await debit_balance(db, snapshot.id, bet)
+        if balance is None:
+            balance = await db.scalar(select(Member.balance).where(Member.id == snapshot.id))
+            if balance is None:
+                await message.reply("Пользователь не найден в базе данных.")
                 return
 
-            member.balance -= bet
-            db.commit()
+            await message.reply(
+                f"💸Недостаточно средств для игры. Ваш баланс: {balance} очков.\n\n⭐️Пополнить баланс можете через /donate"
+            )
+            return
 
+        if is_dice:
+            dice_value = message.dice.value
+        else:
             dice_message = await message.reply_dice(emoji="🎰")
             await asyncio.sleep(1.9)
             dice_value = dice_message.dice.value
 
-        # Если сообщение с dice, то списываем ставку только здесь
-        if getattr(message, "dice", None) and message.dice.emoji == "🎰":
-            if member.balance < bet:
-                await message.reply(
-                    f"💸Недостаточно средств для игры. Ваш баланс: {member.balance} очков.\n\n⭐️Пополнить баланс можете через /donate"
-                )
-                return
-            member.balance -= bet
-            db.commit()
-
         # DRY: единая обработка выигрыша/проигрыша
         score_change = get_score_change(dice_value)
-        winnings = 0
 
         if score_change > 0:
             winnings = int(score_change * bet * 1.6)
-            member.balance += winnings
-            result_text = f"🎉 Поздравляем! Вы выиграли {winnings} очков! 🎉\nВаш текущий баланс: {member.balance}"
-            win = CasinoWin(member_id=member.id, amount=winnings)
-            db.add(win)
+            balance = await credit_winnings(db, snapshot.id, winnings)
+            result_text = f"🎉 Поздравляем! Вы выиграли {winnings} очков! 🎉\nВаш текущий баланс: {balance}"
         else:
-            result_text = f"😢 К сожалению, вы проиграли. Ваш текущий баланс: {member.balance}"
+            result_text = f"😢 К сожалению, вы проиграли. Ваш текущий баланс: {balance}"
 
-        db.commit()
         await message.reply(result_text)
 
     except Exception as e:
         print(f"Ошибка при обработке команды /casino: {e}")
         await message.reply("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
     finally:
-        active_casino_users[message.from_user.id] = False
-        db.close()
-
+        await db.close()
 
 
 async def balance_command(message: Message):
     """
     Обрабатывает команду /balance, показывая текущий баланс пользователя.
     """
-    db = SessionLocal()
+    db = get_session()
 
     try:
         # Проверяем пользователя и разрешения
-        if not await check_user_and_permissions(db, message, '/balance'):
+        snapshot = await check_user_and_permissions(db, message, '/balance')
+        if not snapshot:
             return
         
         # Получаем пользователя из базы данных
-        member = db.query(Member).filter(Member.username == message.from_user.username).first()
+        member = await db.get(Member, snapshot.id)
         if not member:
             await message.reply("Пользователь не найден в базе данных.")
             return
@@ -1894,7 +1862,7 @@ async def balance_command(message: Message):
         print(f"Ошибка при обработке команды /balance: {e}")
         await message.reply("Произошла ошибка при обработке команды. Пожалуйста, попробуйте позже.")
     finally:
-        db.close()
+        await db.close()
 
 
 async def top_casino_winners_command(message):
@@ -1902,9 +1870,9 @@ async def top_casino_winners_command(message):
     Обрабатывает команду для вывода графика топ-5 пользователей с наибольшим выигрышем в казино с последнего воскресенья.
     """
      
-    db = SessionLocal()
-    winners = get_top5_casino_winners_this_week(db)
-    db.close()
+    db = get_session()
+    winners = await get_top5_casino_winners_this_week(db)
+    await db.close()
 
     if not winners:
         await message.answer("С воскресенья ещё никто ничего не выиграл в казино.")
@@ -1925,7 +1893,8 @@ async def top_casino_winners_command(message):
         y_values=wins,
         x_label=x_label,
         y_label=y_label,
-        caption=caption
+        caption=caption,
+        kind="top_casino_winners"
     )
 
 
@@ -1933,9 +1902,9 @@ async def top_casino_winners_alltime_command(message):
     """
     Обрабатывает команду для вывода графика топ-5 пользователей с наибольшим выигрышем в казино за всё время.
     """
-    db = SessionLocal()
-    winners = get_top5_casino_winners_all_time(db)
-    db.close()
+    db = get_session()
+    winners = await get_top5_casino_winners_all_time(db)
+    await db.close()
 
     if not winners:
         await message.answer("Ещё никто не выигрывал в казино.")
@@ -1956,5 +1925,6 @@ async def top_casino_winners_alltime_command(message):
         y_values=wins,
         x_label=x_label,
         y_label=y_label,
-        caption=caption
+        caption=caption,
+        kind="top_casino_winners_alltime"
     )
\ No newline at end of file
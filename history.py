@@ -0,0 +1,193 @@
+# Стандартные библиотеки
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+
+# Библиотеки сторонних разработчиков
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Локальные модули
+from database import get_session
+from models import CommandHistory, CommandDailyStats, UserDailyStats, UserCommandDailyStats
+from config import HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL_MS, HISTORY_QUEUE_SIZE
+
+
+class CommandHistoryWriter:
+    """
+    Отложенная (write-behind) запись истории команд.
+    Хендлеры только кладут запись в очередь, а фоновая задача сохраняет накопленные записи
+    одним bulk insert каждые batch_size записей или flush_interval секунд.
+    В той же транзакции обновляются дневные сводки, по которым считается статистика.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue_size: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: asyncio.Task | None = None
+
+        # Счетчики для мониторинга
+        self.flushed = 0  # Сохранено записей
+        self.dropped = 0  # Отброшено записей из-за переполнения очереди
+        self.failed = 0  # Не удалось сохранить из-за ошибки базы данных
+
+    def enqueue(self, record: dict) -> None:
+        """
+        Добавляет запись в очередь без ожидания. Если очередь переполнена, запись отбрасывается.
+
+        :param record: Значения столбцов CommandHistory
+        """
+
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def start(self) -> None:
+        """Запускает фоновую задачу записи истории."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает все накопленные записи и останавливает фоновую задачу."""
+        if self._task is None:
+            return
+
+        # None в очереди - сигнал завершения после сохранения всего, что было до него
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            record = await self._queue.get()
+            if record is None:
+                return
+
+            batch = [record]
+            deadline = loop.time() + self.flush_interval
+            stopping = False
+
+            # Добираем записи, пока не наберется пачка или не выйдет время
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            await self._flush(batch)
+
+            if stopping:
+                return
+
+    async def _flush(self, batch: list[dict]) -> None:
+        """
+        Сохраняет пачку записей и обновляет дневные сводки одной транзакцией.
+
+        :param batch: Список записей
+        """
+
+        db = get_session()
+        try:
+            await db.execute(insert(CommandHistory), batch)
+            for table, rows in _daily_rollups(batch):
+                await _upsert_counts(db, table, rows)
+            await db.commit()
+            self.flushed += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Ошибка записи истории команд: {e}")
+        finally:
+            await db.close()
+
+    def stats(self) -> dict:
+        """Возвращает счетчики записанных, отброшенных и ожидающих записей."""
+        return {
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+        }
+
+
+def _daily_rollups(batch: list[dict]) -> list[tuple]:
+    """
+    Сворачивает пачку записей истории в счетчики по дням.
+
+    :param batch: Список записей
+    :return: Список пар (таблица сводки, строки для upsert)
+    """
+
+    commands: Counter = Counter()
+    users: Counter = Counter()
+    user_commands: Counter = Counter()
+
+    for record in batch:
+        day = record["timestamp"].date()
+        username = record["username"]
+        command_name = record["command_name"]
+
+        users[day, username] += 1
+        if command_name:
+            commands[day, command_name] += 1
+            user_commands[day, username, command_name] += 1
+
+    return [
+        (CommandDailyStats, [
+            {"day": day, "command_name": name, "count": count}
+            for (day, name), count in commands.items()
+        ]),
+        (UserDailyStats, [
+            {"day": day, "username": username, "count": count}
+            for (day, username), count in users.items()
+        ]),
+        (UserCommandDailyStats, [
+            {"day": day, "username": username, "command_name": name, "count": count}
+            for (day, username, name), count in user_commands.items()
+        ]),
+    ]
+
+
+async def _upsert_counts(db, table, rows: list[dict]) -> None:
+    """
+    Прибавляет счетчики к строкам сводки, создавая недостающие строки.
+
+    :param db: Сессия базы данных
+    :param table: Модель дневной сводки
+    :param rows: Значения ключевых столбцов и count
+    """
+
+    if not rows:
+        return
+
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.__table__.primary_key],
+        set_={"count": table.count + statement.excluded.count},
+    )
+    await db.execute(statement, rows)
+
+
+history_writer = CommandHistoryWriter(
+    batch_size=HISTORY_BATCH_SIZE,
+    flush_interval=HISTORY_FLUSH_INTERVAL_MS / 1000,
+    max_queue_size=HISTORY_QUEUE_SIZE,
+)
+
+
+def utc_now() -> datetime:
+    """
+    Текущее время в UTC без часового пояса - в том же виде, в каком SQLite
+    заполнял timestamp по умолчанию (CURRENT_TIMESTAMP).
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,24 @@
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+# Префикс callback_data кнопок листания списка команд (/teams)
+TEAMS_PAGE_PREFIX = "teams:"
+
+
+def teams_keyboard(page: int, pages: int):
+    """
+    Кнопки перехода между страницами списка команд.
+
+    :param page: Номер текущей страницы, начиная с 0
+    :param pages: Количество страниц
+    :return: Клавиатура или None, если страница одна
+    """
+
+    if pages <= 1:
+        return None
+
+    builder = InlineKeyboardBuilder()
+    if page > 0:
+        builder.button(text="◀️ Назад", callback_data=f"{TEAMS_PAGE_PREFIX}{page - 1}")
+    if page < pages - 1:
+        builder.button(text="Вперед ▶️", callback_data=f"{TEAMS_PAGE_PREFIX}{page + 1}")
+    return builder.as_markup()
@@ -4,22 +4,31 @@ import asyncio
 # Библиотеки сторонних разработчиков
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
-from aiogram import types
 from aiogram.types import BotCommand, Message
 from typing import Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # Локальные модули
-from config import BOT_TOKEN
+from config import BOT_TOKEN, BOT_HTTP_CONNECTION_LIMIT, BOT_HTTP_KEEPALIVE_TIMEOUT, BOT_HTTP_TIMEOUT
 from handlers import (
     add_team_command, add_member_command, remove_team_command, remove_member_command,
     tag_command, help_command, ban_member_command, assign_role_command, teams_command,
     edit_handler_command, help_admin_command, role_manage_command, list_roles_command,
     role_commands_manage_command, list_topics_command, top_casino_winners_alltime_command, top_casino_winners_command, topics_manage_command,
     topics_commands_manage_command, random_number_command, random_choice_command, top_commands_command,
-    top_users_handler_command, top_users_command, notify_command, send_invoice_handler, pre_checkout_handler, success_payment_handler, casino_command, balance_command
+    top_users_handler_command, top_users_command, notify_command, send_invoice_handler, pre_checkout_handler, success_payment_handler, casino_command, balance_command,
+    teams_page_callback
 )
-from tasks import update_balances
+from tasks import update_balances, archive_history
+from database import close_database
+from cache import load_caches
+from history import history_writer
+from charts import chart_renderer
+from metrics import metrics
+from sender import outbound_limiter
+from session import KeepAliveSession
+from notifications import notification_dispatcher
+from keyboards.teams_keyboard import TEAMS_PAGE_PREFIX
 
 
 async def create_bot() -> Tuple[Bot, Dispatcher]:
@@ -29,7 +38,18 @@ async def create_bot() -> Tuple[Bot, Dispatcher]:
     :return: Кортеж из двух объектов — Bot и Dispatcher.
     """
 
-    bot = Bot(token=BOT_TOKEN)
+    # Единственный экземпляр бота: хендлеры получают его от диспетчера (аргумент bot) или через message,
+    # поэтому все запросы к Bot API идут через один пул соединений
+    session = KeepAliveSession(
+        limit=BOT_HTTP_CONNECTION_LIMIT,
+        keepalive_timeout=BOT_HTTP_KEEPALIVE_TIMEOUT,
+        timeout=BOT_HTTP_TIMEOUT,
+    )
+
+    # Лимиты и повторы для исходящих сообщений (см. sender.py)
+    session.middleware(outbound_limiter)
+
+    bot = Bot(token=BOT_TOKEN, session=session)
     dp = Dispatcher()
     return bot, dp
 
@@ -65,7 +85,7 @@ async def set_bot_commands(bot: Bot) -> None:
         BotCommand(command="top_commands", description="Популярные хендлеры"),
         BotCommand(command="top_users_handler", description="Топ пользователей использующих хендлер"),
         BotCommand(command="top_users", description="Топ пользователей вызывающих бота"),
-        BotCommand(command="notify", description="Отложенный /tag"), # Пока не работает
+        BotCommand(command="notify", description="Отложенный /tag"),
         BotCommand(command="donate", description="Купить кредиты"),
         BotCommand(command="casino", description="Казино"),
         BotCommand(command="balance", description="Баланс"),
@@ -102,6 +122,7 @@ def register_handlers(dp: Dispatcher) -> None:
     dp.message(Command("ban_member"))(ban_member_command)
     dp.message(Command("assign_role"))(assign_role_command)
     dp.message(Command("teams"))(teams_command)
+    dp.callback_query(F.data.startswith(TEAMS_PAGE_PREFIX))(teams_page_callback)
     dp.message(Command("edit_handler"))(edit_handler_command)
     dp.message(Command("help_admin"))(help_admin_command)
     dp.message(Command("role_manage"))(role_manage_command)
@@ -150,14 +171,38 @@ async def main() -> None:
     # Регистрация обработчиков команд
     register_handlers(dp)
 
+    # Загрузка кэшей (матрица прав и т.д.)
+    await load_caches()
+
+    # Фоновая запись истории команд
+    history_writer.start()
+
+    # Пул процессов для графиков статистики
+    chart_renderer.start()
+
+    # Отправка отложенных уведомлений /notify (просроченные отправятся сразу)
+    notification_dispatcher.start(bot)
+
     # Раз в неделю обновляет баланс(каждое воскресенье в 00:01)
     scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
     scheduler.add_job(update_balances, 'cron', day_of_week='sun', hour=0, minute=1)
+    # Раз в день переносит старую историю команд в архив (в 04:00)
+    scheduler.add_job(archive_history, 'cron', hour=4, minute=0)
     scheduler.start()
 
     # Запуск бота
     print("Бот запущен...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        # Дописываем историю команд и закрываем соединения с Bot API и базой данных
+        await history_writer.stop()
+        print(f"История команд: {history_writer.stats()}")
+        chart_renderer.stop()
+        await notification_dispatcher.stop()
+        await bot.session.close()
+        print(f"Метрики: {metrics.snapshot()}")
+        await close_database()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+# Стандартные библиотеки
+from collections import defaultdict
+
+
+class Metrics:
+    """
+    Простые метрики в памяти процесса: счетчики и сводки значений (количество, сумма, минимум, максимум).
+    Выводятся при остановке бота, их же можно отдавать во внешний мониторинг через snapshot().
+    """
+
+    def __init__(self):
+        self._counters: dict[str, int] = defaultdict(int)
+        self._summaries: dict[str, list] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Увеличивает счетчик.
+
+        :param name: Имя метрики
+        :param value: На сколько увеличить
+        """
+        self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Добавляет значение в сводку (например, размер или длительность).
+
+        :param name: Имя метрики
+        :param value: Значение
+        """
+
+        summary = self._summaries.get(name)
+        if summary is None:
+            self._summaries[name] = [1, value, value, value]
+            return
+
+        summary[0] += 1
+        summary[1] += value
+        summary[2] = min(summary[2], value)
+        summary[3] = max(summary[3], value)
+
+    def snapshot(self) -> dict:
+        """Возвращает текущие значения всех метрик."""
+        result: dict = dict(self._counters)
+        for name, (count, total, minimum, maximum) in self._summaries.items():
+            result[name] = {
+                "count": count,
+                "avg": total / count,
+                "min": minimum,
+                "max": maximum,
+            }
+        return result
+
+
+metrics = Metrics()
@@ -1,7 +1,7 @@
 # Стандартные библиотеки
 
 # Библиотеки сторонних разработчиков
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Table
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Date, Boolean, Table
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -86,7 +86,36 @@ class CommandHistory(Base):
     user_telegram_id = Column(Integer, nullable=False)  # Telegram ID пользователя
     username = Column(String, nullable=True)  # Имя пользователя Telegram (если есть)
     command = Column(String, nullable=False)  # Команда, которая была выполнена
-    timestamp = Column(DateTime, default=func.now())  # Время выполнения команды
+    command_name = Column(String, nullable=True, index=True)  # Имя команды без аргументов и @бота (например, "/help")
+    timestamp = Column(DateTime, default=func.now(), index=True)  # Время выполнения команды
+
+
+# Дневные сводки по истории команд. Обновляются инкрементально при записи истории (history.py),
+# чтобы статистика за любой период считалась по нескольким строкам на день, а не по всей истории
+
+class CommandDailyStats(Base):
+    __tablename__ = 'command_daily_stats'
+
+    day = Column(Date, primary_key=True)  # День (UTC)
+    command_name = Column(String, primary_key=True)  # Имя команды (например, "/help")
+    count = Column(Integer, nullable=False, default=0)  # Количество вызовов за день
+
+
+class UserDailyStats(Base):
+    __tablename__ = 'user_daily_stats'
+
+    day = Column(Date, primary_key=True)  # День (UTC)
+    username = Column(String, primary_key=True)  # Имя пользователя Telegram
+    count = Column(Integer, nullable=False, default=0)  # Количество обращений к боту за день
+
+
+class UserCommandDailyStats(Base):
+    __tablename__ = 'user_command_daily_stats'
+
+    day = Column(Date, primary_key=True)  # День (UTC)
+    username = Column(String, primary_key=True)  # Имя пользователя Telegram
+    command_name = Column(String, primary_key=True)  # Имя команды
+    count = Column(Integer, nullable=False, default=0)  # Количество вызовов команды пользователем за день
 
 
 class Topic(Base):
@@ -112,4 +141,19 @@ class CasinoWin(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     member_id = Column(Integer, ForeignKey('members.id', ondelete='CASCADE'), nullable=False)
     amount = Column(Integer, nullable=False)
-    timestamp = Column(DateTime, default=func.now())
\ No newline at end of file
+    timestamp = Column(DateTime, default=func.now())
+
+# Отложенные уведомления (/notify). Строка удаляется после отправки,
+# поэтому в таблице лежат только ожидающие уведомления
+
+class Notification(Base):
+    __tablename__ = 'notifications'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # Уникальный идентификатор уведомления
+    chat_id = Column(Integer, nullable=False)  # ID чата, куда отправить уведомление
+    message_thread_id = Column(Integer, nullable=True)  # ID топика (если есть)
+    team_name = Column(String, nullable=False)  # Команда, участников которой нужно упомянуть
+    text = Column(String, nullable=False)  # Текст уведомления (HTML)
+    is_important = Column(Boolean, default=False)  # Важное уведомление
+    created_by = Column(String, nullable=True)  # Имя пользователя, создавшего уведомление
+    due_at = Column(DateTime, nullable=False, index=True)  # Когда отправить (UTC)
@@ -0,0 +1,364 @@
+# Стандартные библиотеки
+import asyncio
+import heapq
+import re
+from datetime import datetime, timedelta, timezone
+from html import escape
+from zoneinfo import ZoneInfo
+
+# Библиотеки сторонних разработчиков
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError,
+)
+from sqlalchemy import delete, select, tuple_
+
+# Локальные модули
+from database import get_session
+from models import Notification
+from cache import team_index
+from history import utc_now
+from sender import bulk_send
+from utils import generate_notification_message, split_mentions, MESSAGE_TEXT_LIMIT
+from config import NOTIFY_TIMEZONE, NOTIFY_WINDOW_SIZE, NOTIFY_RETRY_DELAY
+
+
+# Время уведомления: "день.месяц час:минута" или "день.месяц.год час:минута"
+TIME_PATTERN = re.compile(r"^(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?\s+(\d{1,2}):(\d{2})$")
+
+
+def parse_notify_time(text: str, now: datetime | None = None) -> datetime | None:
+    """
+    Переводит время из /notify (в часовом поясе NOTIFY_TIMEZONE) в UTC.
+    Если год не указан и дата в этом году уже прошла, берется следующий год.
+
+    :param text: Время в формате "день.месяц час:минута" (год после месяца можно указать)
+    :param now: Текущее время в UTC (по умолчанию utc_now())
+    :return: Время отправки в UTC без часового пояса или None, если формат неверный
+    """
+
+    match = TIME_PATTERN.match(text.strip())
+    if not match:
+        return None
+
+    day, month, year, hour, minute = match.groups()
+    now = now or utc_now()
+    zone = ZoneInfo(NOTIFY_TIMEZONE)
+    local_year = int(year) if year else now.replace(tzinfo=timezone.utc).astimezone(zone).year
+
+    try:
+        due_at = datetime(local_year, int(month), int(day), int(hour), int(minute), tzinfo=zone)
+        if not year and due_at.astimezone(timezone.utc).replace(tzinfo=None) < now:
+            due_at = due_at.replace(year=local_year + 1)
+    except ValueError:
+        return None
+
+    return due_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def format_notify_time(due_at: datetime) -> str:
+    """
+    Форматирует время отправки уведомления для пользователя.
+
+    :param due_at: Время в UTC без часового пояса
+    :return: Строка вида "25.12.2026 18:00" в часовом поясе NOTIFY_TIMEZONE
+    """
+    return due_at.replace(tzinfo=timezone.utc).astimezone(ZoneInfo(NOTIFY_TIMEZONE)).strftime("%d.%m.%Y %H:%M")
+
+
+def build_notification_messages(notifications: list[Notification], mentions: list[str]) -> list[tuple[str, list[int]]]:
+    """
+    Собирает уведомления одного чата, которые нужно отправить одновременно, в сообщения:
+    тексты уведомлений, затем упоминания участников их команд и авторы (как в /tag).
+    Все, что не помещается в одно сообщение, переносится в следующие.
+
+    :param notifications: Уведомления одного чата (и топика) в порядке времени отправки
+    :param mentions: Готовые (экранированные) упоминания участников команд без повторов
+    :return: Пары (текст сообщения (HTML), ID уведомлений, которые считаются отправленными после
+        этого сообщения) в порядке отправки. Уведомления из последнего сообщения с текстом
+        считаются отправленными вместе с последней частью упоминаний
+    """
+
+    sections = []
+    for notification in notifications:
+        formatted_message, *_ = generate_notification_message(
+            team_name=notification.team_name,
+            custom_message=notification.text,
+            time=format_notify_time(notification.due_at),
+            chat_id=notification.chat_id,
+            message_thread_id=notification.message_thread_id,
+        )
+        if notification.is_important:
+            formatted_message = "❗️ <b>Важное уведомление</b>\n" + formatted_message
+        sections.append(formatted_message)
+
+    authors = list(dict.fromkeys(f"@{n.created_by}" for n in notifications if n.created_by))
+    footer = f"\n<i>{escape('Напоминание от ' + ', '.join(authors))}</i>" if authors else ""
+
+    # Тексты уведомлений - по порядку, пока помещаются в сообщение
+    messages = []
+    current = ""
+    current_ids = []
+    for notification, section in zip(notifications, sections):
+        if current and len(current) + len(section) + 2 > MESSAGE_TEXT_LIMIT - len(footer):
+            messages.append((current, current_ids))
+            current = section
+            current_ids = []
+        else:
+            current = f"{current}\n\n{section}" if current else section
+        current_ids.append(notification.id)
+
+    # Упоминания - в последнее сообщение с текстом, остальные - следующими сообщениями
+    first_limit = max(0, MESSAGE_TEXT_LIMIT - len(current) - len(footer) - len("\n\n<i></i>"))
+    mention_chunks = split_mentions(mentions, first_limit, MESSAGE_TEXT_LIMIT - len("<i></i>"))
+
+    if mention_chunks[0]:
+        current += f"\n\n<i>{mention_chunks[0]}</i>"
+    follow_ups = [f"<i>{chunk}</i>" for chunk in mention_chunks[1:]]
+
+    messages.append((current + footer, [] if follow_ups else current_ids))
+    messages.extend(
+        (text, current_ids if index == len(follow_ups) - 1 else [])
+        for index, text in enumerate(follow_ups)
+    )
+    return messages
+
+
+class NotificationDispatcher:
+    """
+    Отправка отложенных уведомлений /notify. Уведомления хранятся в таблице notifications,
+    а в памяти лежит только куча (heap) ближайших по времени уведомлений: (due_at, id).
+    Куча пополняется из базы окнами по window_size строк по индексу due_at, поэтому память
+    не растет с количеством уведомлений. Фоновая задача спит до ближайшего срока и отправляет
+    все уведомления, срок которых наступил, одним сообщением на чат. Просроченные уведомления
+    (пока бот был выключен) отправляются сразу после запуска. После отправки строки удаляются.
+    """
+
+    # Максимальное время сна: на случай, если системные часы перевели
+    MAX_SLEEP = 60
+
+    def __init__(self, window_size: int, retry_delay: float):
+        self.window_size = window_size
+        self.retry_delay = retry_delay
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+
+        self._heap: list[tuple[datetime, int]] = []
+        # Последняя загруженная из базы строка (due_at, id): все, что не позже нее, уже в куче
+        self._cursor: tuple[datetime, int] = (datetime.min, 0)
+        # Есть ли в базе строки после курсора
+        self._has_more = True
+        # Уведомления, созданные во время загрузки окна: (due_at, id), None - загрузка не идет
+        self._created_during_load: list[tuple[datetime, int]] | None = None
+        # Уведомления, которые уже отправлены, но еще не удалены из базы (удаление не удалось)
+        self._sent_ids: set[int] = set()
+
+        # Счетчики для мониторинга
+        self.sent = 0  # Отправлено уведомлений
+        self.failed = 0  # Не удалось отправить (чат недоступен и т.д.)
+
+    def start(self, bot: Bot) -> None:
+        """
+        Запускает фоновую задачу отправки уведомлений.
+
+        :param bot: Бот, от имени которого отправляются уведомления
+        """
+
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу. Неотправленные уведомления остаются в базе."""
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def create(self, db, **values) -> Notification:
+        """
+        Сохраняет уведомление в базе и сообщает о нем фоновой задаче.
+
+        :param db: Сессия базы данных
+        :param values: Значения столбцов Notification
+        :return: Созданное уведомление
+        """
+
+        notification = Notification(**values)
+        db.add(notification)
+        await db.commit()
+
+        key = (notification.due_at, notification.id)
+        if self._created_during_load is not None:
+            # Окно сейчас загружается: курсор сдвинется, уведомление разберет _load_window
+            self._created_during_load.append(key)
+        elif key <= self._cursor:
+            heapq.heappush(self._heap, key)
+        else:
+            # Уведомления после курсора загрузятся из базы вместе со следующим окном
+            self._has_more = True
+        self._wakeup.set()
+        return notification
+
+    async def _load_window(self) -> None:
+        """Дозагружает в кучу следующие по времени уведомления после курсора."""
+        self._created_during_load = []
+        db = get_session()
+        try:
+            rows = (
+                await db.execute(
+                    select(Notification.due_at, Notification.id)
+                    .where(tuple_(Notification.due_at, Notification.id) > self._cursor)
+                    .order_by(Notification.due_at, Notification.id)
+                    .limit(self.window_size)
+                )
+            ).all()
+        finally:
+            await db.close()
+            created, self._created_during_load = self._created_during_load, None
+
+        loaded = set()
+        for due_at, notification_id in rows:
+            heapq.heappush(self._heap, (due_at, notification_id))
+            loaded.add(notification_id)
+        if rows:
+            self._cursor = tuple(rows[-1])
+        self._has_more = len(rows) == self.window_size
+
+        # Уведомления, созданные во время запроса, могли в него не попасть
+        for key in created:
+            if key > self._cursor:
+                self._has_more = True
+            elif key[1] not in loaded:
+                heapq.heappush(self._heap, key)
+
+    async def _run(self) -> None:
+        while True:
+            # Сбрасываем сигнал до проверки кучи, чтобы не пропустить уведомление, созданное во время проверки
+            self._wakeup.clear()
+            try:
+                if self._has_more and len(self._heap) < self.window_size // 2:
+                    await self._load_window()
+
+                now = utc_now()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[1])
+
+                if due:
+                    await self._deliver(due)
+                    continue
+
+                # Если куча опустела, а в базе еще есть уведомления - сначала загружаем окно
+                if not self._heap and self._has_more:
+                    continue
+
+                timeout = self.MAX_SLEEP
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Ошибка базы данных: пробуем снова чуть позже, уведомления остаются в базе
+                print(f"Ошибка отправки уведомлений: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def _forget(self, db, notification_ids: list[int] | set[int], pending: set[int]) -> None:
+        """
+        Удаляет отправленные уведомления из базы.
+
+        :param db: Сессия базы данных
+        :param notification_ids: ID уведомлений
+        :param pending: ID уведомлений, которые еще не удалены (из них убираются удаленные)
+        """
+
+        await db.execute(delete(Notification).where(Notification.id.in_(notification_ids)))
+        await db.commit()
+        pending.difference_update(notification_ids)
+        self._sent_ids.difference_update(notification_ids)
+
+    async def _deliver(self, notification_ids: list[int]) -> None:
+        """
+        Отправляет уведомления, срок которых наступил: по одному набору сообщений на чат (и топик).
+        Уведомления удаляются из базы после каждого отправленного сообщения, поэтому после ошибки
+        повторно отправляются только те, что еще не ушли. Все, что не удалось отправить или
+        удалить из базы, возвращается в кучу и повторяется через retry_delay.
+
+        :param notification_ids: ID уведомлений
+        """
+
+        pending = set(notification_ids)
+        db = get_session()
+        try:
+            # Уже отправлены, но не удалены из базы в прошлый раз - только удаляем
+            already_sent = pending & self._sent_ids
+            if already_sent:
+                await self._forget(db, already_sent, pending)
+
+            notifications = (
+                await db.scalars(
+                    select(Notification)
+                    .where(Notification.id.in_(pending))
+                    .order_by(Notification.due_at, Notification.id)
+                )
+            ).all() if pending else []
+
+            # Остальные уже удалены из базы
+            pending.intersection_update(notification.id for notification in notifications)
+
+            chats: dict[tuple[int, int | None], list[Notification]] = {}
+            for notification in notifications:
+                chats.setdefault((notification.chat_id, notification.message_thread_id), []).append(notification)
+
+            for (chat_id, message_thread_id), chat_notifications in chats.items():
+                mentions = []
+                for team_name in dict.fromkeys(n.team_name for n in chat_notifications):
+                    team = await team_index.get_team(db, team_name)
+                    if team:
+                        mentions.extend(team.mentions)
+
+                try:
+                    for text, sent_ids in build_notification_messages(chat_notifications, list(dict.fromkeys(mentions))):
+                        with bulk_send():
+                            await self._bot.send_message(
+                                chat_id=chat_id,
+                                message_thread_id=message_thread_id,
+                                text=text,
+                                parse_mode="HTML",
+                            )
+                        if sent_ids:
+                            self._sent_ids.update(sent_ids)
+                            self.sent += len(sent_ids)
+                            await self._forget(db, sent_ids, pending)
+                except (TelegramBadRequest, TelegramForbiddenError) as e:
+                    # Чат недоступен или сообщение некорректно - повтор не поможет
+                    print(f"Уведомления для чата {chat_id} не отправлены: {e}")
+                    failed_ids = [n.id for n in chat_notifications if n.id in pending]
+                    self.failed += len(failed_ids)
+                    await self._forget(db, failed_ids, pending)
+                except (TelegramNetworkError, TelegramRetryAfter, TelegramServerError) as e:
+                    # Неотправленные уведомления чата останутся в pending и вернутся в кучу
+                    print(f"Ошибка отправки уведомлений в чат {chat_id}: {e}, повтор через {self.retry_delay} с")
+        except Exception as e:
+            print(f"Ошибка отправки уведомлений: {e}, повтор через {self.retry_delay} с")
+        finally:
+            await db.close()
+
+            if pending:
+                retry_at = utc_now() + timedelta(seconds=self.retry_delay)
+                for notification_id in pending:
+                    heapq.heappush(self._heap, (retry_at, notification_id))
+
+
+notification_dispatcher = NotificationDispatcher(window_size=NOTIFY_WINDOW_SIZE, retry_delay=NOTIFY_RETRY_DELAY)
@@ -0,0 +1,179 @@
+# Стандартные библиотеки
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Библиотеки сторонних разработчиков
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+# Локальные модули
+from metrics import metrics
+from config import (
+    SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_PRIVATE_RATE, SEND_PRIVATE_BURST,
+    SEND_GROUP_RATE, SEND_GROUP_BURST, SEND_MAX_RETRIES, SEND_MAX_WAIT,
+)
+
+
+# Методы Bot API, которые создают сообщения в чате и попадают под лимиты Telegram
+LIMITED_METHOD_PREFIXES = ("send", "forward", "copy")
+
+# Отправки внутри bulk_send() - массовая рассылка, см. OutboundRateLimiter
+_bulk = ContextVar("bulk_send", default=False)
+
+
+@contextmanager
+def bulk_send():
+    """
+    Помечает сообщения, отправленные внутри блока, как массовую рассылку (продолжения /tag,
+    уведомления /notify). Такие сообщения соблюдают лимит чата и отправляются строго по очереди.
+    """
+
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+class TokenBucket:
+    """
+    Ведро токенов: не больше burst запросов подряд, дальше - rate запросов в секунду.
+    Ожидающие получают токены по очереди.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Не выдает токены seconds секунд (после RetryAfter от Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    def is_idle(self) -> bool:
+        """Ведро уже наполнилось до burst, его состояние можно не хранить."""
+        now = time.monotonic()
+        return now >= self._paused_until and self._tokens + (now - self._updated) * self.rate >= self.burst
+
+    async def acquire(self) -> None:
+        """Ждет, пока в ведре появится токен, и забирает его."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatQueue:
+    """Очередь и лимит массовой рассылки в один чат."""
+
+    def __init__(self, bucket: TokenBucket):
+        self.lock = asyncio.Lock()  # Пропускает ожидающих по порядку, поэтому порядок сообщений сохраняется
+        self.bucket = bucket
+        self.pending = 0
+
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """
+    Планировщик исходящих сообщений на уровне HTTP-сессии бота: через него проходят все
+    message.answer/reply, bot.send_* и т.д. Все сообщения соблюдают общий лимит бота.
+    Массовая рассылка (bulk_send) дополнительно соблюдает лимит чата и отправляется по очереди,
+    поэтому обычные ответы хендлеров не ждут за ней в очереди чата.
+    На TelegramRetryAfter сообщение повторяется после паузы, при этом очередь чата на время паузы
+    освобождается. Обычный ответ ждет не дольше max_wait секунд, иначе ошибка возвращается сразу,
+    чтобы хендлер не держал сессию базы данных минутами.
+    """
+
+    # Сколько чатов держать в памяти, прежде чем удалять простаивающие
+    MAX_IDLE_CHATS = 1000
+
+    def __init__(self, max_retries: int, max_wait: float):
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.global_bucket = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+        self._chats: dict[int | str, ChatQueue] = {}
+        self.pending = 0
+
+    def _chat(self, chat_id: int | str) -> ChatQueue:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) >= self.MAX_IDLE_CHATS:
+                self._prune()
+
+            # Отрицательные ID и @username - группы и каналы, у них лимит ниже, чем у личных чатов
+            if not isinstance(chat_id, int) or chat_id < 0:
+                bucket = TokenBucket(SEND_GROUP_RATE, SEND_GROUP_BURST)
+            else:
+                bucket = TokenBucket(SEND_PRIVATE_RATE, SEND_PRIVATE_BURST)
+            chat = self._chats[chat_id] = ChatQueue(bucket)
+        return chat
+
+    def _prune(self) -> None:
+        """Удаляет чаты без ожидающих сообщений, у которых ведро уже успело наполниться."""
+        for chat_id, chat in list(self._chats.items()):
+            if chat.pending == 0 and chat.bucket.is_idle():
+                del self._chats[chat_id]
+
+    async def _send(self, make_request, bot, method, chat: ChatQueue, bulk: bool):
+        """Одна попытка отправки с учетом лимитов; для массовой рассылки - в очереди чата."""
+        if not bulk:
+            await self.global_bucket.acquire()
+            return await make_request(bot, method)
+
+        async with chat.lock:
+            await chat.bucket.acquire()
+            await self.global_bucket.acquire()
+            return await make_request(bot, method)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not method.__api_method__.startswith(LIMITED_METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        bulk = _bulk.get()
+        chat = self._chat(chat_id)
+        chat.pending += 1
+        self.pending += 1
+        metrics.observe("send_queue_depth", self.pending)
+        queued_at = time.monotonic()
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self._send(make_request, bot, method, chat, bulk)
+                except TelegramRetryAfter as e:
+                    metrics.increment("send_retry_after")
+                    # Ждем сколько сказал Telegram, а при повторных ошибках - дольше
+                    delay = e.retry_after * (1 + attempt)
+                    # Массовая рассылка в этот чат тоже подождет
+                    chat.bucket.pause(delay)
+
+                    waited = time.monotonic() - queued_at
+                    if attempt == self.max_retries or (not bulk and waited + delay > self.max_wait):
+                        raise
+                    print(f"Лимит Telegram для чата {chat_id}: повтор через {delay} с")
+
+                # Пауза вне очереди чата
+                await asyncio.sleep(delay)
+        finally:
+            metrics.observe("send_total_ms", (time.monotonic() - queued_at) * 1000)
+            self.pending -= 1
+            chat.pending -= 1
+
+
+outbound_limiter = OutboundRateLimiter(max_retries=SEND_MAX_RETRIES, max_wait=SEND_MAX_WAIT)
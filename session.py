@@ -0,0 +1,14 @@
+# Библиотеки сторонних разработчиков
+from aiogram.client.session.aiohttp import AiohttpSession
+
+
+class KeepAliveSession(AiohttpSession):
+    """
+    HTTP-сессия бота с настраиваемым keep-alive: простаивающие соединения с Bot API живут
+    keepalive_timeout секунд, поэтому запросы после паузы не открывают новое TLS-соединение.
+    Остальное поведение (прокси, пересоздание коннектора, закрытие) - как у AiohttpSession.
+    """
+
+    def __init__(self, keepalive_timeout: float, **kwargs):
+        super().__init__(**kwargs)
+        self._connector_init["keepalive_timeout"] = keepalive_timeout
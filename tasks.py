@@ -1,6 +1,7 @@
 from database import SessionLocal
 
 from models import Member
+from archive import archive_command_history
 
 
 def update_balances():
@@ -19,3 +20,17 @@ def update_balances():
         print(f"Ошибка обновления баланса: {e}")
     finally:
         db.close()
+
+
+def archive_history():
+    """
+    Функция для переноса старой истории команд в сжатые помесячные архивы (см. archive.py)
+
+    :return: Нет возвращаемого значения (None).
+    """
+    print("Попытка архивировать историю команд")
+    try:
+        archived = archive_command_history()
+        print(f"Перенесено в архив записей: {archived}")
+    except Exception as e:
+        print(f"Ошибка архивации истории команд: {e}")
@@ -1,29 +1,31 @@
 # Стандартные библиотеки
+import asyncio
 from datetime import datetime, timedelta
 import re
 import random
-import os
-import numpy as np
-import uuid
 
 # Библиотеки сторонних разработчиков
-from aiogram.types import Message, FSInputFile
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-import matplotlib.pyplot as plt
-from matplotlib.colors import LinearSegmentedColormap
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, BufferedInputFile
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from html import escape
 
 # Локальные модули
-from models import CommandHistory, Member, Command, RoleCommands, Role, Topic, CasinoWin
-from config import ALLOWED_CHAT_IDS, STYLE_URL
+from models import Member, Role, CasinoWin, CommandDailyStats, UserDailyStats, UserCommandDailyStats
+from config import ALLOWED_CHAT_IDS, TEAMS_PAGE_SIZE
+from cache import permission_matrix, topic_index, member_cache, chart_cache, MemberSnapshot, TeamSnapshot
+from history import history_writer, utc_now
+from charts import chart_renderer, ChartQueueFull, get_profile
+from metrics import metrics
 
 
-async def log_command_history(db: Session, user_id: int, user_telegram_id: int, username: str, command_text: str) -> None:
+def log_command_history(user_id: int, user_telegram_id: int, username: str, command_text: str) -> None:
     """
-    Сохраняет информацию о выполненной команде в базе данных.
+    Ставит информацию о выполненной команде в очередь на запись в базу данных.
+    Запись сохраняется фоновой задачей пачками (см. history.py), хендлер не ждет commit.
     
-    :param db: Сессия базы данных
     :param user_id: Идентификатор пользователя в базе данных
     :param user_telegram_id: Telegram ID пользователя
     :param username: Имя пользователя
@@ -35,17 +37,17 @@ async def log_command_history(db: Session, user_id: int, user_telegram_id: int,
     if command_text is None:
         command_text = ""
 
-    history = CommandHistory(
-        user_id=user_id,
-        user_telegram_id=user_telegram_id,
-        username=username,
-        command=command_text
-    )
-    db.add(history)
-    db.commit()
+    history_writer.enqueue({
+        "user_id": user_id,
+        "user_telegram_id": user_telegram_id,
+        "username": username,
+        "command": command_text,
+        "command_name": extract_command_name(command_text),
+        "timestamp": utc_now(),  # Время вызова, а не время записи пачки
+    })
 
 
-def get_or_create_member(username: str, telegram_id: int, db: Session) -> Member:
+async def get_or_create_member(username: str, telegram_id: int, db: AsyncSession) -> Member:
     """
     Проверяет, существует ли пользователь в базе данных. Если нет, создаёт его с дефолтной ролью.
     
@@ -55,28 +57,30 @@ def get_or_create_member(username: str, telegram_id: int, db: Session) -> Member
     :return: Объект члена команды (Member)
     """
 
-    member = db.query(Member).filter(Member.username == username).first()
+    member = await db.scalar(
+        select(Member).options(joinedload(Member.role)).where(Member.username == username)
+    )
     
     if not member:
         # Если пользователя нет, создаем нового пользователя с ролью "default_user"
-        default_role = db.query(Role).filter(Role.role_name == 'default_user').first()
+        default_role = await db.scalar(select(Role).where(Role.role_name == 'default_user'))
 
         if not default_role:
             # Если роль по умолчанию не найдена, создаем её
             default_role = Role(role_name='default_user')
             db.add(default_role)
-            db.commit()
+            await db.commit()
 
         # Создаем нового пользователя с ролью по умолчанию и Telegram ID
-        member = Member(username=username, telegram_id=telegram_id, role_id=default_role.id, balance=5000)
+        member = Member(username=username, telegram_id=telegram_id, role=default_role, balance=5000)
         db.add(member)
-        db.commit()
+        await db.commit()
         print(f"Создан новый пользователь с ролью {default_role.role_name}")
 
     # Если у пользователя нет telegram_id (он равен None), то обновляем его
     if not member.telegram_id:
         member.telegram_id = telegram_id
-        db.commit()
+        await db.commit()
         print(f"Обновлен telegram_id для пользователя {member.username}")
 
     # Проверка, если роль почему-то не была присвоена
@@ -86,44 +90,28 @@ def get_or_create_member(username: str, telegram_id: int, db: Session) -> Member
     return member
 
 
-async def has_permission(member: Member, command_name: str, command_text: str, db: Session) -> bool:
+async def has_permission(member: MemberSnapshot, command_name: str, command_text: str, db: AsyncSession) -> bool:
     """
     Проверяет, есть ли у пользователя права на выполнение указанной команды.
     
-    :param member: Объект пользователя (Member)
+    :param member: Снимок пользователя (MemberSnapshot)
     :param command_name: Имя команды
     :param command_text: Текст команды
     :param db: Сессия базы данных
     :return: True, если пользователь имеет право на выполнение команды, False — если нет
     """
 
-    # Получаем роль пользователя
-    role = member.role
-    if not role:
-        # Логируем команду даже если нет роли
-        await log_command_history(db, member.id, member.telegram_id, member.username, command_text)
-        return False  # Если роль не найдена, доступа нет
-
-    # Ищем команду в базе данных
-    command = db.query(Command).filter(Command.command_name == command_name).first()
-    if not command:
-        # Логируем команду, если она не найдена
-        await log_command_history(db, member.id, member.telegram_id, member.username, command_text)
-        return False  # Если команда не найдена, доступ запрещен
+    # Логируем команду (даже если доступа нет)
+    log_command_history(member.id, member.telegram_id, member.username, command_text)
 
-    # Проверяем, есть ли данная команда у роли
-    role_command = db.query(RoleCommands).filter(
-        RoleCommands.role_id == role.id,
-        RoleCommands.command_id == command.id
-    ).first()
-
-    # Логируем команду
-    await log_command_history(db, member.id, member.telegram_id, member.username, command_text)
+    if not member.role_id:
+        return False  # Если роль не найдена, доступа нет
 
-    return role_command is not None  # Если команда найдена в роли, доступ разрешен
+    # Проверяем команду по матрице прав в памяти, без запросов к базе данных
+    return await permission_matrix.has_command(db, member.role_id, command_name)
 
 
-def is_command_allowed_in_topic(db: Session, topic_name: str, command_name: str) -> bool:
+async def is_command_allowed_in_topic(db: AsyncSession, topic_name: str, command_name: str) -> bool:
     """
     Проверяет, разрешена ли команда в указанном топике.
     
@@ -133,32 +121,91 @@ def is_command_allowed_in_topic(db: Session, topic_name: str, command_name: str)
     :return: True, если команда разрешена в данном топике, иначе False
     """
 
-    # Находим топик по имени
-    topic = db.query(Topic).filter(Topic.topic_name == topic_name).first()
-    if not topic:
-        # Топик не найден
-        return False
+    # Проверяем по индексу топиков в памяти, без запросов к базе данных
+    return await topic_index.is_allowed(db, topic_name, command_name)
+
+
+async def get_member_snapshot(db: AsyncSession, message: Message) -> MemberSnapshot:
+    """
+    Возвращает снимок пользователя, отправившего сообщение. Сначала ищет его в кэше по Telegram ID,
+    при промахе загружает (или создает) пользователя одним запросом и кладет снимок в кэш.
+
+    :param db: Сессия базы данных
+    :param message: Сообщение от пользователя
+    :return: Снимок пользователя (MemberSnapshot)
+    """
+
+    telegram_id = message.from_user.id
+    username = message.from_user.username
+
+    snapshot = member_cache.get(telegram_id)
+    if snapshot and snapshot.username == username:
+        return snapshot
+
+    # Пользователя нет в кэше или он сменил username
+    member_cache.invalidate(telegram_id)
+
+    # Проверяем, есть ли такой пользователь, если нет - создаем
+    member = await get_or_create_member(username, telegram_id, db)
+
+    snapshot = MemberSnapshot.from_member(member)
+    member_cache.put(telegram_id, snapshot)
+    return snapshot
+
+
+async def get_targets_by_username(db: AsyncSession, usernames: list[str]) -> dict:
+    """
+    Загружает пользователей-целей модерации (бан, назначение роли) вместе с уровнями их ролей одним запросом.
+
+    :param db: Сессия базы данных
+    :param usernames: Имена пользователей без @
+    :return: Словарь username -> строка (id, role_id, role_level); role_level равен None, если роли нет
+    """
+
+    rows = await db.execute(
+        select(Member.username, Member.id, Member.role_id, Role.level.label("role_level"))
+        .outerjoin(Role, Role.id == Member.role_id)
+        .where(Member.username.in_(usernames))
+        .order_by(Member.id)
+    )
+
+    targets = {}
+    for row in rows:
+        targets.setdefault(row.username, row)
+    return targets
 
-    # Находим команду по имени
-    command = db.query(Command).filter(Command.command_name == command_name).first()
-    if not command:
-        # Команда не найдена
-        return False
 
-    # Проверяем, разрешена ли команда в данном топике
-    if command in topic.allowed_commands:
-        return True
-    return False
+async def set_members_role(db: AsyncSession, targets: list, role_id: int) -> None:
+    """
+    Назначает роль сразу нескольким пользователям одним UPDATE и убирает их из кэша пользователей.
+    Изменения нужно сохранить через commit.
+
+    :param db: Сессия базы данных
+    :param targets: Пользователи из get_targets_by_username
+    :param role_id: ID новой роли
+    """
+
+    if not targets:
+        return
+
+    await db.execute(
+        update(Member)
+        .where(Member.id.in_([target.id for target in targets]))
+        .values(role_id=role_id)
+        .execution_options(synchronize_session=False)
+    )
+    for target in targets:
+        member_cache.invalidate_username(target.username)
 
 
-async def check_user_and_permissions(db: Session, message: Message, command_name: str) -> bool:
+async def check_user_and_permissions(db: AsyncSession, message: Message, command_name: str) -> MemberSnapshot | None:
     """
     Проверяет наличие пользователя, его права и разрешение команды в текущем топике или чате.
     
     :param db: Сессия базы данных
     :param message: Сообщение от пользователя
     :param command_name: Имя команды, для которой проверяется разрешение
-    :return: True, если все проверки пройдены, False - если какая-либо проверка не пройдена
+    :return: Снимок пользователя (MemberSnapshot), если все проверки пройдены, None - если какая-либо проверка не пройдена
     """
 
     # print(message.chat.id)
@@ -166,13 +213,10 @@ async def check_user_and_permissions(db: Session, message: Message, command_name
     # Проверяем, что команда вызывается в одном из разрешенных чатов
     if message.chat.id not in ALLOWED_CHAT_IDS:
         await message.reply("Эта команда доступна только в разрешенных чатах.")
-        return False
+        return None
     
-    # Проверяем, есть ли такой пользователь, если нет - создаем
-    get_or_create_member(message.from_user.username, message.from_user.id, db)
-
-    # Получаем информацию о пользователе
-    member = db.query(Member).filter(Member.username == message.from_user.username).first()
+    # Получаем информацию о пользователе (из кэша или из базы данных)
+    member = await get_member_snapshot(db, message)
 
     # Получаем название топика, в котором была вызвана команда
     if (
@@ -187,11 +231,11 @@ async def check_user_and_permissions(db: Session, message: Message, command_name
 
     # Проверка на разрешение команды для данного топика
     if topic_name:
-        command_allowed = is_command_allowed_in_topic(db, topic_name, command_name)
+        command_allowed = await is_command_allowed_in_topic(db, topic_name, command_name)
         if not command_allowed:
             await message.reply("Данная команда не разрешена в этом топике.")
-            db.close()
-            return False
+            await db.close()
+            return None
 
     # Проверка прав пользователя на выполнение команды
     # Если message.caption пустой, используем message.text
@@ -200,10 +244,10 @@ async def check_user_and_permissions(db: Session, message: Message, command_name
     if not await has_permission(member, command_name, caption_or_text, db): 
         print(caption_or_text)
         await message.reply("У вас нет прав для выполнения этой команды.")
-        db.close()
-        return False
+        await db.close()
+        return None
 
-    return True
+    return member
 
 
 def extract_command_name(full_command: str) -> str:
@@ -230,6 +274,100 @@ def extract_command_name(full_command: str) -> str:
     return command_name
 
 
+# Ограничения Telegram на длину текста сообщения и подписи к медиа (в символах)
+MESSAGE_TEXT_LIMIT = 4096
+MESSAGE_CAPTION_LIMIT = 1024
+
+
+def split_mentions(mentions: list[str], first_limit: int, limit: int) -> list[str]:
+    """
+    Разбивает упоминания на части, чтобы каждая часть помещалась в сообщение.
+
+    :param mentions: Список упоминаний (например, "@username")
+    :param first_limit: Сколько символов доступно упоминаниям в первом сообщении (может быть 0)
+    :param limit: Сколько символов доступно упоминаниям в каждом следующем сообщении
+    :return: Список строк с упоминаниями через пробел; первая строка может быть пустой
+    """
+
+    chunks = []
+    current = []
+    current_length = 0
+    budget = first_limit
+
+    for mention in mentions:
+        added = len(mention) + (1 if current else 0)
+        if current_length + added > budget and (current or budget < limit):
+            chunks.append(" ".join(current))
+            current = []
+            current_length = 0
+            budget = limit
+            added = len(mention)
+        current.append(mention)
+        current_length += added
+
+    chunks.append(" ".join(current))
+    return chunks
+
+
+def _join_usernames(usernames: tuple[str, ...], limit: int) -> str:
+    """
+    Перечисляет пользователей через запятую, сокращая список до limit символов.
+
+    :param usernames: Имена пользователей
+    :param limit: Максимальная длина строки
+    :return: Строка вида "user1, user2 и еще 10"
+    """
+
+    shown = []
+    length = 0
+    # Место под " и еще N" на случай, если все имена не поместятся
+    reserve = len(f" и еще {len(usernames)}")
+
+    for username in usernames:
+        added = len(username) + (2 if shown else 0)
+        if length + added > limit - reserve:
+            return ", ".join(shown) + f" и еще {len(usernames) - len(shown)}"
+        shown.append(username)
+        length += added
+
+    return ", ".join(shown)
+
+
+def format_teams_page(teams: list[tuple[str, TeamSnapshot]], page: int, page_size: int = TEAMS_PAGE_SIZE) -> tuple[str, int, int]:
+    """
+    Формирует страницу списка команд для /teams. Длинные названия и списки участников сокращаются,
+    чтобы страница всегда помещалась в одно сообщение.
+
+    :param teams: Пары (название команды, состав команды)
+    :param page: Номер страницы, начиная с 0 (номер за пределами списка приводится к ближайшей странице)
+    :param page_size: Сколько команд показывать на странице
+    :return: Текст страницы (HTML), номер показанной страницы и количество страниц
+    """
+
+    pages = max(1, -(-len(teams) // page_size))
+    page = min(max(page, 0), pages - 1)
+
+    if not teams:
+        return "<b>Список команд и их участников:</b>\n\nНет доступных команд.", page, pages
+
+    # Лимит Telegram считается по тексту без HTML-разметки; делим его поровну между командами страницы
+    budget = (MESSAGE_TEXT_LIMIT - 100) // page_size - len("Команда: \nУчастники: \n\n")
+
+    teams_list = ""
+    for team_name, team in teams[page * page_size:(page + 1) * page_size]:
+        if len(team_name) > 64:
+            team_name = team_name[:63] + "…"
+        team_members = escape(_join_usernames(team.usernames, budget - len(team_name))) if team.usernames else "Нет участников"
+
+        teams_list += f"<b>Команда:</b> {escape(team_name)}\n"
+        teams_list += f"<b>Участники:</b> {team_members}\n\n"
+
+    text = f"<b>Список команд и их участников:</b>\n\n{teams_list}"
+    if pages > 1:
+        text += f"<i>Страница {page + 1} из {pages}</i>"
+    return text, page, pages
+
+
 def parse_quoted_argument(command_text: str, command_name: str) -> tuple[str, str, str]:
     """
     Обрабатывает команды форматов:
@@ -279,90 +417,7 @@ async def delete_user_message(message: Message):
         print(f"Ошибка при удалении сообщения: {e}")
 
 
-def generate_bar_chart(title, x_labels, y_values, x_label, y_label):
-    """
-    Генерирует столбчатый график с индивидуальным градиентом для каждого столбца.
-    Сохраняет график в PNG-файл и возвращает имя файла.
-    """
-    if not x_labels or not y_values:
-        raise ValueError("Нет данных для построения графика")
-
-    filename = f"chart_{uuid.uuid4().hex}.png"
-
-    with plt.style.context(STYLE_URL):
-        plt.rcParams['font.family'] = 'DejaVu Sans'  # Поддержка кириллицы и эмодзи
-
-        fig, ax = plt.subplots(figsize=(12, 6))
-
-        # Определяем цветовые пары для градиентов
-        gradient_colors = [
-            ("#00FFFF", "#0066FF"),
-            ("#FF6F61", "#FF2E63"),
-            ("#FFC048", "#FF7F50"),
-            ("#9AECDB", "#55E6C1"),
-            ("#D6A2E8", "#C44569"),
-            ("#A3CB38", "#009432"),
-            ("#F5C469", "#FF9F1A"),
-        ]
-
-        # Построение столбцов с градиентом
-        bar_width = 0.6
-        x_positions = np.arange(len(x_labels))
-
-        # Определяем верхний предел для оси Y с отступом (10% выше максимума)
-        max_y = max(y_values) * 1.15  
-        ax.set_ylim(0, max_y)  
-
-        for i, (x, y) in enumerate(zip(x_positions, y_values)):
-            start_color, end_color = gradient_colors[i % len(gradient_colors)]
-            cmap = LinearSegmentedColormap.from_list(f"bar_{i}", [start_color, end_color])
-
-            # Создаем вертикальный градиент
-            gradient = np.linspace(0, 1, 256).reshape(256, 1)
-            ax.imshow(
-                gradient,
-                extent=(x - bar_width / 2, x + bar_width / 2, 0, y),
-                cmap=cmap,
-                aspect='auto',
-                zorder=2
-            )
-
-            # Значения над столбцами
-            ax.text(
-                x,
-                y + (max_y * 0.02),  # Отступ сверху для читаемости
-                f"{y}",
-                ha='center',
-                fontsize=12,
-                fontweight="bold",
-                color="white"
-            )
-
-        # Настройки осей и подписей
-        ax.set_xticks(x_positions)
-        ax.set_xticklabels(x_labels, fontsize=12, color='white', rotation=0) 
-        ax.set_title(title, fontsize=18, fontweight="bold", color="white", pad=20)
-        ax.set_xlabel(x_label, fontsize=14, fontweight="bold", color="white", labelpad=10)
-        ax.set_ylabel(y_label, fontsize=14, fontweight="bold", color="white", labelpad=10)
-
-        # Масштабирование по горизонтали с отступами
-        ax.set_xlim(-0.5, len(x_labels) - 0.5)
-
-        # Стилизация осей и сетки
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['left'].set_color('white')
-        ax.spines['bottom'].set_color('white')
-        ax.grid(True, linestyle='--', alpha=0.5, color='gray')
-
-        plt.tight_layout()
-        plt.savefig(filename, format='png', dpi=200)
-        plt.close()
-
-    return filename
-
-
-async def send_chart(message, title, x_labels, y_values, x_label, y_label, caption):
+async def send_chart(message, title, x_labels, y_values, x_label, y_label, caption, kind=None):
     """
     Генерирует график и отправляет его пользователю.
 
@@ -373,15 +428,39 @@ async def send_chart(message, title, x_labels, y_values, x_label, y_label, capti
     :param x_label: Подпись оси X.
     :param y_label: Подпись оси Y.
     :param caption: Подпись к отправляемому изображению.
+    :param kind: Вид графика, по нему выбирается профиль рендеринга (CHART_PROFILE_BY_KIND в config.py).
     """
-    filename = generate_bar_chart(title, x_labels, y_values, x_label, y_label)
+    profile = get_profile(kind)
+
+    # Такой же график недавно уже отправлялся - пересылаем его по file_id без построения и загрузки
+    key = chart_cache.make_key(profile, title, tuple(x_labels), tuple(y_values), x_label, y_label)
+    file_id = chart_cache.get(key)
+    if file_id is not None:
+        try:
+            await message.answer_photo(photo=file_id, caption=caption)
+            metrics.increment("chart_cache_hits")
+            return
+        except TelegramBadRequest:
+            chart_cache.invalidate(key)
 
     try:
-        photo = FSInputFile(filename)
-        await message.answer_photo(photo=photo, caption=caption)
-    finally:
-        if os.path.exists(filename):
-            os.remove(filename)
+        image = await chart_renderer.render(title, list(x_labels), list(y_values), x_label, y_label, profile)
+    except (ChartQueueFull, asyncio.TimeoutError):
+        metrics.increment("charts_rejected")
+        await message.reply("❌ Сейчас строится слишком много графиков, попробуйте позже.")
+        return
+    except Exception as e:
+        # Процесс пула упал или ошибка внутри построения графика
+        print(f"Ошибка построения графика: {e!r}")
+        metrics.increment("charts_failed")
+        await message.reply("❌ Не удалось построить график, попробуйте позже.")
+        return
+
+    metrics.observe(f"chart_bytes_{profile.name}", len(image))
+    photo = BufferedInputFile(image, filename=f"chart.{profile.extension}")
+    sent = await message.answer_photo(photo=photo, caption=caption)
+    if sent.photo:
+        chart_cache.put(key, sent.photo[-1].file_id)
 
 
 def get_score_change(dice_value: int) -> int:
@@ -404,6 +483,81 @@ def get_score_change(dice_value: int) -> int:
         return -1
     
 
+def _debit_balance(session, member_id: int, amount: int) -> int | None:
+    balance = session.execute(
+        update(Member)
+        .where(Member.id == member_id, Member.balance >= amount)
+        .values(balance=Member.balance - amount)
+        .returning(Member.balance)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    session.commit()
+    return balance
+
+
+def _increase_balance(session, member_id: int, amount: int) -> int:
+    return session.execute(
+        update(Member)
+        .where(Member.id == member_id)
+        .values(balance=Member.balance + amount)
+        .returning(Member.balance)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+
+def _credit_balance(session, member_id: int, amount: int) -> int:
+    balance = _increase_balance(session, member_id, amount)
+    session.commit()
+    return balance
+
+
+def _credit_winnings(session, member_id: int, amount: int) -> int:
+    balance = _increase_balance(session, member_id, amount)
+    session.add(CasinoWin(member_id=member_id, amount=amount))
+    session.commit()
+    return balance
+
+
+async def debit_balance(db: AsyncSession, member_id: int, amount: int) -> int | None:
+    """
+    Списывает ставку одним условным UPDATE: баланс меняется, только если на нем достаточно средств,
+    поэтому одновременные прокрутки не уводят баланс в минус. Изменение сразу сохраняется.
+    UPDATE и commit выполняются одним вызовом run_sync, чтобы транзакция не ждала свободного
+    потока, пока другие прокрутки ждут ее блокировку.
+
+    :param db: Сессия базы данных
+    :param member_id: ID пользователя в базе данных
+    :param amount: Сумма списания
+    :return: Новый баланс или None, если средств недостаточно
+    """
+    return await db.run_sync(_debit_balance, member_id, amount)
+
+
+async def credit_balance(db: AsyncSession, member_id: int, amount: int) -> int:
+    """
+    Пополняет баланс одним UPDATE ... RETURNING и сразу сохраняет изменение,
+    поэтому пополнение не затирает ставки и выигрыши, списанные или начисленные параллельно.
+
+    :param db: Сессия базы данных
+    :param member_id: ID пользователя в базе данных
+    :param amount: Сумма пополнения
+    :return: Новый баланс
+    """
+    return await db.run_sync(_credit_balance, member_id, amount)
+
+
+async def credit_winnings(db: AsyncSession, member_id: int, amount: int) -> int:
+    """
+    Начисляет выигрыш и записывает его в историю выигрышей казино одной транзакцией.
+
+    :param db: Сессия базы данных
+    :param member_id: ID пользователя в базе данных
+    :param amount: Сумма выигрыша
+    :return: Новый баланс
+    """
+    return await db.run_sync(_credit_winnings, member_id, amount)
+
+
 def generate_notification_message(
     team_name: str,
     custom_message: str,
@@ -438,7 +592,7 @@ def generate_notification_message(
     return formatted_message, time_escaped, chat_id, message_thread_id
 
 
-def get_top5_casino_winners_this_week(db):
+async def get_top5_casino_winners_this_week(db):
     """
     Получает топ-5 пользователей по суммарному выигрышу в казино с последнего воскресенья.
     :param db: Сессия базы данных
@@ -453,30 +607,102 @@ def get_top5_casino_winners_this_week(db):
 
     # Группируем суммы выигрышей по member_id
     results = (
-        db.query(Member.username, func.sum(CasinoWin.amount).label('total_wins'))
-        .join(Member, Member.id == CasinoWin.member_id)
-        .filter(CasinoWin.timestamp >= last_sunday)
-        .group_by(Member.username)
-        .order_by(func.sum(CasinoWin.amount).desc())
-        .limit(5)
-        .all()
-    )
+        await db.execute(
+            select(Member.username, func.sum(CasinoWin.amount).label('total_wins'))
+            .join(Member, Member.id == CasinoWin.member_id)
+            .where(CasinoWin.timestamp >= last_sunday)
+            .group_by(Member.username)
+            .order_by(func.sum(CasinoWin.amount).desc())
+            .limit(5)
+        )
+    ).all()
     # results = [(username1, win1), ...]
     return results
 
 
-def get_top5_casino_winners_all_time(db):
+async def get_top5_casino_winners_all_time(db):
     """
     Получает топ-5 пользователей по суммарному выигрышу в казино за всё время.
     :param db: Сессия базы данных
     :return: Список кортежей (username, сумма выигрыша)
     """
     results = (
-        db.query(Member.username, func.sum(CasinoWin.amount).label('total_wins'))
-        .join(Member, Member.id == CasinoWin.member_id)
-        .group_by(Member.username)
-        .order_by(func.sum(CasinoWin.amount).desc())
-        .limit(5)
-        .all()
-    )
-    return results
\ No newline at end of file
+        await db.execute(
+            select(Member.username, func.sum(CasinoWin.amount).label('total_wins'))
+            .join(Member, Member.id == CasinoWin.member_id)
+            .group_by(Member.username)
+            .order_by(func.sum(CasinoWin.amount).desc())
+            .limit(5)
+        )
+    ).all()
+    return results
+
+
+async def get_top_commands(db, start_date: datetime, limit: int = 5):
+    """
+    Получает самые популярные команды начиная с указанной даты.
+    Считается по дневным сводкам, поэтому период округляется до начала дня start_date.
+    :param db: Сессия базы данных
+    :param start_date: Начало периода
+    :param limit: Количество команд в топе
+    :return: Список кортежей (имя команды, количество вызовов)
+    """
+    call_count = func.sum(CommandDailyStats.count).label('call_count')
+    results = (
+        await db.execute(
+            select(CommandDailyStats.command_name, call_count)
+            .where(CommandDailyStats.day >= start_date.date())
+            .group_by(CommandDailyStats.command_name)
+            .order_by(call_count.desc())
+            .limit(limit)
+        )
+    ).all()
+    return results
+
+
+async def get_top_users_for_command(db, command_name: str, start_date: datetime, limit: int = 5):
+    """
+    Получает пользователей, чаще всего вызывавших команду, начиная с указанной даты.
+    Считается по дневным сводкам, поэтому период округляется до начала дня start_date.
+    :param db: Сессия базы данных
+    :param command_name: Имя команды (например, "/help")
+    :param start_date: Начало периода
+    :param limit: Количество пользователей в топе
+    :return: Список кортежей (username, количество вызовов)
+    """
+    call_count = func.sum(UserCommandDailyStats.count).label('call_count')
+    results = (
+        await db.execute(
+            select(UserCommandDailyStats.username, call_count)
+            .where(
+                UserCommandDailyStats.day >= start_date.date(),
+                UserCommandDailyStats.command_name == command_name,
+            )
+            .group_by(UserCommandDailyStats.username)
+            .order_by(call_count.desc())
+            .limit(limit)
+        )
+    ).all()
+    return results
+
+
+async def get_top_users(db, start_date: datetime, limit: int = 5):
+    """
+    Получает пользователей, чаще всего обращавшихся к боту, начиная с указанной даты.
+    Считается по дневным сводкам, поэтому период округляется до начала дня start_date.
+    :param db: Сессия базы данных
+    :param start_date: Начало периода
+    :param limit: Количество пользователей в топе
+    :return: Список кортежей (username, количество обращений)
+    """
+    call_count = func.sum(UserDailyStats.count).label('call_count')
+    results = (
+        await db.execute(
+            select(UserDailyStats.username, call_count)
+            .where(UserDailyStats.day >= start_date.date())
+            .group_by(UserDailyStats.username)
+            .order_by(call_count.desc())
+            .limit(limit)
+        )
+    ).all()
+    return results